@@ -1,14 +1,21 @@
-import litellm
-from litellm import completion_cost
 import yaml
 import polars as pl
 import sys
 import os
+import asyncio
+import json
+import time
 from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from prompts.prompts import PROMPT_ANALYSIS
 from tools.tools import Tools
+from tools.executor import run_blocking, run_sql
+from tools.plot_worker import PlotWorkerPool
+from tools.chart import ChartSpecError, build_chart_spec
+from agents.runner import AgentRunner, Budget
+from agents.compaction import CompactionPolicy
+from metrics import agent_plot_generations_total, agent_plot_duration_seconds
 
 load_dotenv()
 
@@ -23,18 +30,67 @@ if configs['run_state'] == "integrated":
 
 MODEL_ANALYSIS_AGENT = configs['models']['MODEL_ANALYSIS_AGENT']
 
+PLOTS = configs.get('plots', {})
+PLOT_DPI = PLOTS.get('dpi', 150)
+CHART_MAX_POINTS = configs.get('charts', {}).get('max_points', 5000)
+AGENTS = configs.get('agents', {})
+MAX_PARALLEL_TOOL_CALLS = AGENTS.get('max_parallel_tool_calls', 4)
+ANALYSIS_BUDGET = Budget.from_config(AGENTS.get('budgets', {}).get('analysis', {}))
+PROMPT_CACHE_CONTROL = AGENTS.get('prompt_cache', {}).get('cache_control', True)
+COMPACTION = CompactionPolicy.from_config(AGENTS.get('compaction', {}))
+# Shared by every request in this worker; workers are forked on the first plot
+plot_pool = PlotWorkerPool(
+    size=PLOTS.get('workers', 2),
+    max_renders=PLOTS.get('max_renders_per_worker', 50),
+    timeout=PLOTS.get('timeout_seconds', 30),
+    memory_limit_bytes=PLOTS.get('memory_limit_mb', 1024) * 1024 * 1024,
+    cpu_seconds=PLOTS.get('cpu_seconds', 20)
+)
+
 class analysisAgent():
-    def __init__(self, df: pl.DataFrame, req_id: str):
+    def __init__(self, df: pl.DataFrame, req_id: str, tools: Tools = None, on_event=None):
         self.df = df
-        self.tools = Tools(df)
+        self.tools = tools if tools is not None else Tools(df)
         self.request_id = req_id
+        self.on_event = on_event
+
+    def emit(self, event: dict) -> None:
+        if self.on_event is not None:
+            self.on_event({"agent": "analysis", **event})
+
+    async def _run_sql(self, query: str):
+        """run_sql, reporting the query and its timing as an sql event"""
+        started = time.monotonic()
+        result = await run_sql(self.tools, query)
+        event = {"type": "sql", "query": query, "duration_seconds": round(time.monotonic() - started, 3)}
+        if isinstance(result, pl.DataFrame):
+            self.tools.queries.append(query)
+            self.emit({**event, "status": "success", "rows": result.height})
+        else:
+            self.emit({**event, "status": "failed", "error": result.get("error") if isinstance(result, dict) else str(result)})
+        return result
 
     async def sql(self, query: str):
-        """Execute SQL query on dataframe"""
-        return self.tools.sql(query)
+        """Execute SQL query on dataframe off the event loop and render the result within the context budget"""
+        result = await self._run_sql(query)
+        if isinstance(result, pl.DataFrame):
+            return self.tools.render(result)
+        return result
+
+    async def page_result(self, handle: str, offset: int = 0, limit: int = None, columns: list = None):
+        """Return a page of rows from a truncated sql() result"""
+        return self.tools.page_result(handle, offset=offset, limit=limit, columns=columns)
+
+    async def distinct_values(self, column: str, offset: int = 0, limit: int = None):
+        """Return distinct values of a column with frequencies from the upload-time index, off the event loop"""
+        return await run_blocking(lambda cancel: self.tools.distinct_values(column, offset=offset, limit=limit, cancel=cancel))
+
+    async def find_values(self, column: str, terms: list, limit: int = None):
+        """Return column values that fuzzily match the search terms from the trigram index, off the event loop"""
+        return await run_blocking(lambda cancel: self.tools.find_values(column, terms, limit=limit, cancel=cancel))
 
     async def plot(self, code: str):
-        """Execute matplotlib plotting code and return image bytes"""
+        """Execute matplotlib plotting code in the plot worker pool and return image bytes"""
         try:
             clean_code = code.strip()
             if clean_code.startswith('```python'):
@@ -44,56 +100,30 @@ class analysisAgent():
             if clean_code.endswith('```'):
                 clean_code = clean_code[:-3]
             clean_code = clean_code.strip()
-
-            import matplotlib
-            matplotlib.use('Agg')
-            import matplotlib.pyplot as plt
-            import io
-            import base64
-
-            env = {"df": self.df, "plt": plt, "io": io}
-            exec(clean_code, env)
-
-            if 'result' not in env:
-                return {"error": "Code execution completed but 'result' variable was not assigned. Make sure to assign the matplotlib figure to 'result' variable.", "status": "failed"}
-
-            fig = env['result']
-            if fig is None:
-                return {"error": "'result' variable is None. Make sure to assign a valid matplotlib figure object to 'result'.", "status": "failed"}
-            buf = io.BytesIO()
-            fig.savefig(buf, format='png', bbox_inches='tight', dpi=150)
-            buf.seek(0)
-            image_bytes = base64.b64encode(buf.read()).decode('utf-8')
-            plt.close(fig)
+            started = time.monotonic()
+            dataset_path = await asyncio.to_thread(self.tools.ipc_path)
+            png = await asyncio.to_thread(plot_pool.render, clean_code, dataset_path, PLOT_DPI)
+            agent_plot_duration_seconds.observe(time.monotonic() - started)
+            agent_plot_generations_total.labels(status="success").inc()
 
             result = {
-                "image_bytes": image_bytes,
                 "status": "success",
-                "message": "Plot created successfully",
-                "request_id": self.request_id
+                "message": "Plot created successfully and sent to the user",
+                "request_id": self.request_id,
+                "size_bytes": len(png)
             }
 
             if configs['run_state'] == "integrated":
-                db = SessionLocal()
-                try:
-                    crud.create_plot(db, schemas.PlotCreate(
-                        message_id=None,
-                        request_id=UUID(self.request_id),
-                        image_data=base64.b64decode(image_bytes)
-                    ))
-                    db.commit()
-                    print(f"[DEBUG] Plot saved to database with request_id: {self.request_id}")
-                except Exception as db_err:
-                    db.rollback()
-                    result["warning"] = f"Failed to save plot to database: {str(db_err)}"
-                    print(f"[DEBUG] Database save error: {str(db_err)}")
-                finally:
-                    db.close()
+                position, warning = await asyncio.to_thread(self._save_plot, png)
+                if position is not None:
+                    self.emit({"type": "plot_ready", "request_id": self.request_id, "position": position, "kind": "image"})
+                if warning:
+                    result["warning"] = warning
             else:
                 try:
                     output_path = os.path.join(os.path.dirname(__file__), f"plot_output_{self.request_id}.png")
                     with open(output_path, "wb") as f:
-                        f.write(base64.b64decode(image_bytes))
+                        f.write(png)
                     result["local_path"] = output_path
                     print(f"[DEBUG] Plot saved to: {output_path}")
                 except Exception as save_err:
@@ -102,9 +132,62 @@ class analysisAgent():
 
             return result
         except Exception as e:
+            agent_plot_generations_total.labels(status="failed").inc()
             error_result = {"error": str(e), "status": "failed", "message": f"Plotting failed: {str(e)}"}
             print(f"[DEBUG] Plot error: {str(e)}")
             return error_result
+
+    async def chart(self, query: str, mark: str, encoding: dict, title: str = None):
+        """Build a Vega-Lite chart spec from a SQL result; the client renders it, no server rasterizing"""
+        data = await self._run_sql(query)
+        if not isinstance(data, pl.DataFrame):
+            return data
+        try:
+            spec = build_chart_spec(data, mark, encoding, title=title, max_points=CHART_MAX_POINTS)
+        except ChartSpecError as e:
+            return {"error": str(e), "status": "failed"}
+
+        result = {
+            "status": "success",
+            "message": "Chart created successfully and sent to the user",
+            "request_id": self.request_id,
+            "points": data.height
+        }
+        if configs['run_state'] == "integrated":
+            position, warning = await asyncio.to_thread(self._save_plot, spec=spec)
+            if position is not None:
+                self.emit({"type": "plot_ready", "request_id": self.request_id, "position": position, "kind": "chart"})
+            if warning:
+                result["warning"] = warning
+        else:
+            try:
+                output_path = os.path.join(os.path.dirname(__file__), f"chart_output_{self.request_id}.json")
+                with open(output_path, "w") as f:
+                    json.dump(spec, f)
+                result["local_path"] = output_path
+            except Exception as save_err:
+                result["warning"] = f"Failed to save chart locally: {str(save_err)}"
+        return result
+
+    def _save_plot(self, png: bytes = None, spec: dict = None) -> tuple[int | None, str | None]:
+        """Store the raw PNG or chart spec for this request; returns its position, or a warning if saving failed"""
+        db = SessionLocal()
+        try:
+            plot = crud.create_plot(db, schemas.PlotCreate(
+                message_id=None,
+                request_id=UUID(self.request_id),
+                image_data=png,
+                spec=spec
+            ))
+            db.commit()
+            print(f"[DEBUG] Plot saved to database with request_id: {self.request_id}")
+            return plot.position, None
+        except Exception as db_err:
+            db.rollback()
+            print(f"[DEBUG] Database save error: {str(db_err)}")
+            return None, f"Failed to save plot to database: {str(db_err)}"
+        finally:
+            db.close()
             
 
 
@@ -124,15 +207,90 @@ TOOLS_ANALYSIS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "page_result",
+            "description": "Read more rows of a sql() result that was truncated. Large results come back as a summary with a handle; pass that handle here to page through the full result.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "handle": {"type": "string", "description": "Result handle from a truncated sql() output, e.g. 'r1'"},
+                    "offset": {"type": "integer", "description": "Number of rows to skip (use next_offset from the previous page)"},
+                    "limit": {"type": "integer", "description": "Maximum number of rows to return (default and maximum 50)"},
+                    "columns": {"type": "array", "items": {"type": "string"}, "description": "Only return these columns of the result"},
+                },
+                "required": ["handle"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "distinct_values",
+            "description": "List the distinct values of a column with their row counts, most frequent first. Answered instantly from a precomputed index - use this instead of SELECT DISTINCT for discovery. Paginate with offset when has_more is true.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string", "description": "Exact column name"},
+                    "offset": {"type": "integer", "description": "Number of values to skip (use next_offset from the previous page)"},
+                    "limit": {"type": "integer", "description": "Maximum number of values to return (default and maximum 100)"},
+                },
+                "required": ["column"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_values",
+            "description": "Fuzzy-search the values of a text column for several terms at once (typos, abbreviations and partial names included). Returns ranked candidate values with row counts from a precomputed index - use this instead of LOWER(col) LIKE '%...%' scans, then filter with the exact values returned.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string", "description": "Exact name of a text column"},
+                    "terms": {"type": "array", "items": {"type": "string"}, "description": "Search terms, e.g. ['cafe', 'coffee', 'starbucks']"},
+                    "limit": {"type": "integer", "description": "Maximum number of candidates to return (default and maximum 20)"},
+                },
+                "required": ["column", "terms"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "chart",
+            "description": "Create a standard chart (bar, line, point/scatter or area) as a declarative Vega-Lite spec that the user's browser renders. Much faster and lighter than plot() - prefer it whenever the chart fits these marks. The chart's data is the result of a SQL query, so aggregate in SQL first.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "SQL query on 'self' returning exactly the rows to draw (at most 5000), e.g. SELECT Category, SUM(Amount) AS total FROM self GROUP BY Category"},
+                    "mark": {"type": "string", "enum": ["bar", "line", "point", "area"], "description": "Chart type"},
+                    "encoding": {
+                        "type": "object",
+                        "description": "Vega-Lite encodings. Each channel is {field: column of the query result, type: quantitative|nominal|ordinal|temporal, title: optional axis title}",
+                        "properties": {
+                            "x": {"type": "object"},
+                            "y": {"type": "object"},
+                            "color": {"type": "object", "description": "Optional: split into series by this column"}
+                        },
+                        "required": ["x", "y"]
+                    },
+                    "title": {"type": "string", "description": "Chart title"}
+                },
+                "required": ["query", "mark", "encoding"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
             "name": "plot",
-            "description": "Create a matplotlib visualization and return image bytes. The bytes are automatically sent to frontend via WebSocket.",
+            "description": "Create a custom matplotlib visualization when chart() can't express it. The rendered PNG is stored and shown to the user automatically.",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "code": {"type": "string", "description": "Python code that creates a matplotlib figure. Must use Polars DataFrame 'df' and assign final figure to 'result' variable. Returns base64-encoded PNG bytes."},
+                    "code": {"type": "string", "description": "Python code that creates a matplotlib figure. Must use Polars DataFrame 'df' and assign final figure to 'result' variable."},
                 },
                 "required": ["code"]
             }
@@ -140,17 +298,38 @@ TOOLS_ANALYSIS = [
     }
 ]
 
-async def get_func_mapper_analysis_agent(df: pl.DataFrame, req_id: str):
-    agent = analysisAgent(df, req_id)
+async def get_func_mapper_analysis_agent(df: pl.DataFrame, req_id: str, tools: Tools = None, on_event=None):
+    agent = analysisAgent(df, req_id, tools=tools, on_event=on_event)
     return {
         "sql": agent.sql,
+        "page_result": agent.page_result,
+        "distinct_values": agent.distinct_values,
+        "find_values": agent.find_values,
+        "chart": agent.chart,
         "plot": agent.plot
     }
 
-async def run_analysis_agent(df: pl.DataFrame, req_id: str, input: str = None, messages: list = None, prompt: str = None, is_plotting: bool = False):
-    total_cost = 0
+class AnalysisRunner(AgentRunner):
+    """Analysis agent loop; remembers whether a plot or chart was produced"""
 
-    func_mapper = await get_func_mapper_analysis_agent(df, req_id)
+    def __init__(self, *args, is_plotting: bool = False, **kwargs):
+        super().__init__("analysis", MODEL_ANALYSIS_AGENT, TOOLS_ANALYSIS, *args, cache_control=PROMPT_CACHE_CONTROL, compaction=COMPACTION, **kwargs)
+        self.is_plotting = is_plotting
+
+    def tool_content(self, tool_call, result) -> str:
+        if tool_call.function.name in ("plot", "chart") and not (isinstance(result, dict) and result.get("status") == "failed"):
+            self.is_plotting = True
+        return str(result)
+
+async def run_analysis_agent(df: pl.DataFrame, req_id: str, input: str = None, messages: list = None, prompt: str = None, is_plotting: bool = False, tools: Tools = None, semaphore: asyncio.Semaphore = None, deadline: float = None, on_event=None, tenant: str = None):
+    """
+    Run the analysis agent to an answer within ANALYSIS_BUDGET; returns (answer, cost, is_plotting).
+    on_event receives progress events (see AgentRunner), including sql and plot_ready.
+    tenant scopes the completion cache; without it completions are never cached.
+    """
+    if semaphore is None:
+        # Caps concurrent tool calls for the whole request; shared by parallel analysis runs
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOL_CALLS)
 
     if input:
         if prompt is None:
@@ -166,62 +345,16 @@ async def run_analysis_agent(df: pl.DataFrame, req_id: str, input: str = None, m
             }
         ]
     elif messages:
-        messages = messages
+        messages = messages.copy()
     else:
         raise ValueError("No input or messages provided")
 
-    context = messages.copy()
-    response = await litellm.acompletion(
-        model = MODEL_ANALYSIS_AGENT,
-        messages = messages,
-        tools = TOOLS_ANALYSIS,
-        tool_choice = "auto",
-        seed = 42
-    )
-
-    cost = completion_cost(completion_response=response)
-    total_cost+=cost
-
-    response_message = response.choices[0].message
-    tool_calls = response_message.tool_calls
-
-    if tool_calls is None or len(tool_calls) == 0:
-        return response_message.content, total_cost, is_plotting
-
-    if tool_calls is not None and len(tool_calls) > 0:
-        context.append(response_message)
-        for tool_call in tool_calls:
-            import json
-            print(f"Calling function: {tool_call.function.name}")
-            print(f"Arguments: {tool_call.function.arguments}")
-            func_mapper = await get_func_mapper_analysis_agent(df, req_id)
-            function = func_mapper[tool_call.function.name]
-            args = json.loads(tool_call.function.arguments) if isinstance(tool_call.function.arguments, str) else tool_call.function.arguments
-            result = await function(**args)
-            if tool_call.function.name == "plot":
-                is_plotting = True
-                context.append(
-                    {
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": tool_call.function.name,
-                        "content": str({k: v for k, v in result.items() if k != "image_bytes"})
-                    })
-            else:
-                context.append(
-                    {
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": tool_call.function.name,
-                        "content": str(result)
-                    })
-
-        final_result, cost_nested, is_plotting_nested = await run_analysis_agent(df, req_id, messages=context, is_plotting=is_plotting)
-        total_cost += cost_nested
-        is_plotting = is_plotting_nested
-        if final_result is None:
-            raise ValueError("No result from the analysis agent")
-        return final_result, total_cost, is_plotting
+    func_mapper = await get_func_mapper_analysis_agent(df, req_id, tools=tools, on_event=on_event)
+    runner = AnalysisRunner(func_mapper, ANALYSIS_BUDGET, deadline=deadline, semaphore=semaphore, on_event=on_event, tenant=tenant, is_plotting=is_plotting)
+    final_result = await runner.run(messages)
+    if final_result is None:
+        raise ValueError("No result from the analysis agent")
+    return final_result, runner.total_cost, runner.is_plotting
     
 
 ANALYSIS_AGENT_TOOL = {
@@ -0,0 +1,105 @@
+import re
+from dataclasses import dataclass
+
+# Rough size of a token in characters; only used to decide when and how much to compact
+CHARS_PER_TOKEN = 4
+COMPACTED_PREFIX = "[compacted]"
+
+_HANDLE = re.compile(r"handle '(\w+)'")
+
+
+@dataclass
+class CompactionPolicy:
+    """Per-turn context budget for an agent loop; None max_tokens disables compaction"""
+    max_tokens: int = None
+    keep_recent: int = 2
+    summary_chars: int = 200
+
+    @classmethod
+    def from_config(cls, config: dict) -> "CompactionPolicy":
+        return cls(
+            max_tokens=config.get('max_context_tokens'),
+            keep_recent=config.get('keep_recent_tool_results', 2),
+            summary_chars=config.get('summary_chars', 200)
+        )
+
+
+def _get(message, name: str):
+    return message.get(name) if isinstance(message, dict) else getattr(message, name, None)
+
+
+def _text(message) -> str:
+    parts = [str(_get(message, "content") or "")]
+    for call in _get(message, "tool_calls") or []:
+        function = call["function"] if isinstance(call, dict) else call.function
+        parts.append(str(_get(function, "name") or ""))
+        parts.append(str(_get(function, "arguments") or ""))
+    return "".join(parts)
+
+
+def estimate_tokens(messages: list) -> int:
+    return sum(len(_text(m)) for m in messages) // CHARS_PER_TOKEN
+
+
+def _tool_calls_by_id(messages: list) -> dict:
+    calls = {}
+    for message in messages:
+        for call in _get(message, "tool_calls") or []:
+            function = call["function"] if isinstance(call, dict) else call.function
+            calls[_get(call, "id")] = (_get(function, "name"), str(_get(function, "arguments") or ""))
+    return calls
+
+
+def _summary(name: str, arguments: str, content: str, handles: set, summary_chars: int) -> str:
+    first_line = content.strip().splitlines()[0] if content.strip() else ""
+    if len(first_line) > summary_chars:
+        first_line = first_line[:summary_chars] + "..."
+    if len(arguments) > summary_chars:
+        arguments = arguments[:summary_chars] + "..."
+    if handles:
+        again = " or ".join(f"page_result(handle='{h}')" for h in sorted(handles))
+    else:
+        again = f"call {name} again"
+    return (
+        f"{COMPACTED_PREFIX} Earlier {name}({arguments}) result, already used: {first_line} "
+        f"Full output removed to save context; {again} if you need it."
+    )
+
+
+def compact_messages(messages: list, policy: CompactionPolicy) -> int:
+    """
+    Replace tool outputs the model has already responded to with one-line summaries, oldest
+    first, until messages fit policy.max_tokens (estimated). The last keep_recent tool outputs
+    and any output whose result handle a later assistant message refers to stay verbatim.
+    Messages are changed in place and stay compacted, so the prompt prefix is stable (and
+    cacheable) again from the next turn on. Returns the estimated tokens saved.
+    """
+    if policy.max_tokens is None:
+        return 0
+    excess = estimate_tokens(messages) - policy.max_tokens
+    if excess <= 0:
+        return 0
+
+    roles = [_get(m, "role") for m in messages]
+    tool_indices = [i for i, role in enumerate(roles) if role == "tool"]
+    last_assistant = max((i for i, role in enumerate(roles) if role == "assistant"), default=-1)
+    protected = set(tool_indices[-policy.keep_recent:]) if policy.keep_recent > 0 else set()
+    calls = _tool_calls_by_id(messages)
+
+    saved = 0
+    for i in tool_indices:
+        if saved >= excess:
+            break
+        content = str(messages[i]["content"])
+        if i in protected or i > last_assistant or content.startswith(COMPACTED_PREFIX):
+            continue
+        handles = set(_HANDLE.findall(content))
+        if handles and any(h in _text(m) for m in messages[i + 1:] if _get(m, "role") == "assistant" for h in handles):
+            continue
+        name, arguments = calls.get(messages[i].get("tool_call_id"), (messages[i].get("name"), ""))
+        summary = _summary(name, arguments, content, handles, policy.summary_chars)
+        if len(summary) >= len(content):
+            continue
+        saved += (len(content) - len(summary)) // CHARS_PER_TOKEN
+        messages[i] = {**messages[i], "content": summary}
+    return saved
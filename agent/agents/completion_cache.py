@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import yaml
+import litellm
+
+from metrics import agent_llm_cache_evictions_total
+
+config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs.yaml")
+with open(config_path, "r") as f:
+    configs = yaml.safe_load(f)
+
+COMPLETION_CACHE = configs.get('agents', {}).get('completion_cache', {})
+
+
+def _message_key(message) -> dict:
+    """
+    The parts of a message that determine the model's reply. Tool call ids are left out:
+    providers generate them randomly, and the ids in a replayed response are consistent with
+    the rest of the run that replays it.
+    """
+    if not isinstance(message, dict):
+        message = message.model_dump() if hasattr(message, "model_dump") else dict(message)
+    tool_calls = message.get("tool_calls") or []
+    return {
+        "role": message.get("role"),
+        "content": message.get("content"),
+        "name": message.get("name"),
+        "tool_calls": [{"name": call["function"]["name"], "arguments": call["function"]["arguments"]} for call in tool_calls]
+    }
+
+
+class CompletionCache:
+    """
+    Exact-match cache of model responses on disk, keyed by a hash of (model, messages, tools,
+    tool_choice, seed). Entries live in one directory per tenant, so a response is only ever
+    replayed to the tenant it was generated for. The whole cache and each tenant are bounded
+    in bytes; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, tenant_max_bytes: int, ttl_seconds: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.tenant_max_bytes = tenant_max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, messages: list, tools: list, tool_choice: str, seed: int) -> str:
+        payload = {
+            "model": model,
+            "messages": [_message_key(m) for m in messages],
+            "tools": tools,
+            "tool_choice": tool_choice,
+            "seed": seed
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, tenant: str, key: str) -> tuple[litellm.ModelResponse, float] | None:
+        """The cached response and what it originally cost, or None"""
+        path = self._path(tenant, key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                self._remove(path, "expired")
+                return None
+            with open(path, "r") as f:
+                entry = json.load(f)
+            # Recency for LRU eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return litellm.ModelResponse(**entry["response"]), entry.get("cost", 0.0)
+
+    def put(self, tenant: str, key: str, response: litellm.ModelResponse, cost: float) -> None:
+        path = self._path(tenant, key)
+        data = json.dumps({"response": json.loads(response.model_dump_json()), "cost": cost}).encode()
+        if len(data) > self.tenant_max_bytes:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._enforce_budget(self._tenant_dir(tenant), self.tenant_max_bytes)
+        self._enforce_budget(self.directory, self.max_bytes)
+
+    def _tenant_dir(self, tenant: str) -> str:
+        # Hashed so tenant ids can't escape the cache directory
+        return os.path.join(self.directory, hashlib.sha256(str(tenant).encode()).hexdigest()[:32])
+
+    def _path(self, tenant: str, key: str) -> str:
+        return os.path.join(self._tenant_dir(tenant), key + ".json")
+
+    def _enforce_budget(self, directory: str, max_bytes: int) -> None:
+        """Remove expired entries, then the least recently used ones, until directory fits max_bytes"""
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path, "expired")
+                else:
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            self._remove(path, "lru")
+            total -= size
+
+    @staticmethod
+    def _remove(path: str, reason: str) -> None:
+        try:
+            os.remove(path)
+            agent_llm_cache_evictions_total.labels(reason=reason).inc()
+        except OSError:
+            pass
+
+
+# Opt-in; shared by every request in this worker and, through the directory, by every worker on the host
+completion_cache = CompletionCache(
+    directory=COMPLETION_CACHE.get('dir', 'cache/completions'),
+    max_bytes=COMPLETION_CACHE.get('max_mb', 512) * 1024 * 1024,
+    tenant_max_bytes=COMPLETION_CACHE.get('tenant_max_mb', 64) * 1024 * 1024,
+    ttl_seconds=COMPLETION_CACHE.get('ttl_seconds', 604800)
+) if COMPLETION_CACHE.get('enabled', False) else None
@@ -1,14 +1,16 @@
 from uuid import uuid4
-import litellm
-from litellm import completion_cost
 import yaml
 import polars as pl
 from functools import partial
+import asyncio
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from agents.analysis import ANALYSIS_AGENT_TOOL, analysisAgent, run_analysis_agent
+from agents.analysis import AGENTS, ANALYSIS_AGENT_TOOL, MAX_PARALLEL_TOOL_CALLS, PROMPT_CACHE_CONTROL, COMPACTION, analysisAgent, run_analysis_agent
+from agents.runner import AgentRunner, Budget
+from agents.memory import History, MemoryPolicy
+from tools.tools import Tools
 from prompts.prompts import PROMPT_MAIN, PROMPT_ANALYSIS
 
 config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs.yaml")
@@ -16,36 +18,32 @@ with open(config_path, "r") as f:
     configs = yaml.safe_load(f)
 
 MODEL_MAIN = configs['models']['MODEL_MAIN']
+MAIN_BUDGET = Budget.from_config(AGENTS.get('budgets', {}).get('main', {}))
+MEMORY = MemoryPolicy.from_config(AGENTS.get('memory', {}))
 
 class MainAgent():
-    def __init__(self, df: pl.DataFrame, request_id: str):
+    def __init__(self, df: pl.DataFrame, request_id: str, profile: dict = None, tools: Tools = None):
         self.df = df
-        self.analysis = analysisAgent(df, request_id)
+        self.analysis = analysisAgent(df, request_id, tools=tools)
+        self.profile = profile
 
     async def accumulate_context(self):
-        """Accumulate context from dataframe analysis"""
-        import asyncio
-        exploration_task = asyncio.create_task(asyncio.to_thread(self.analysis.tools.explore))
-        columns_task = asyncio.create_task(asyncio.to_thread(self.analysis.tools.columns))
-        shape_task = asyncio.create_task(asyncio.to_thread(self.analysis.tools.shape))
-        head_task = asyncio.create_task(asyncio.to_thread(self.analysis.tools.head))
-        tail_task = asyncio.create_task(asyncio.to_thread(self.analysis.tools.tail))
-        info_task = asyncio.create_task(asyncio.to_thread(self.analysis.tools.info))
-
-        exploration = await exploration_task
-        columns = await columns_task
-        shape = await shape_task
-        head = await head_task
-        tail = await tail_task
-        info = await info_task
+        """
+        Accumulate context from the precomputed dataset profile, computing it only if missing.
+        Rendered from the profile alone (no request or time dependent values), so the enriched
+        prompt is byte-identical across calls and follow-up questions and stays prompt-cacheable.
+        """
+        if self.profile is None:
+            self.profile = await asyncio.to_thread(self.analysis.tools.profile)
+        profile = self.profile
 
         context_string = f"""
-        Exploration: {str(exploration)}
-        Columns: {str(columns)}
-        Shape: {shape}
-        Head: {str(head)}
-        Tail: {str(tail)}
-        Info: {info}
+        Exploration: {profile['exploration']}
+        Columns: {str(profile['columns'])}
+        Shape: {tuple(profile['shape'])}
+        Head: {profile['head']}
+        Tail: {profile['tail']}
+        Info: {profile['info']}
         """
         return context_string
 
@@ -55,80 +53,66 @@ class MainAgent():
         return base_prompt + "\n\n Here is some CONTEXT regarding the uploaded CSV file:\n" + context
 
 
-async def run_main_agent(df: pl.DataFrame, input: str = None, messages: list = None, is_plotting: bool = False, request_id: str = None):
-    total_cost = 0
+class MainRunner(AgentRunner):
+    """Main agent loop; its tools are analysis runs, whose cost and plots roll up into this run"""
+
+    def __init__(self, *args, is_plotting: bool = False, **kwargs):
+        super().__init__("main", MODEL_MAIN, [ANALYSIS_AGENT_TOOL], *args, cache_control=PROMPT_CACHE_CONTROL, compaction=COMPACTION, **kwargs)
+        self.is_plotting = is_plotting
+
+    def tool_content(self, tool_call, result) -> str:
+        if isinstance(result, tuple):
+            result, cost_nested, plot_what = result
+            self.is_plotting = self.is_plotting or plot_what
+            self.total_cost += cost_nested
+            self.partial = result
+        return str(result)
+
+async def run_main_agent(df: pl.DataFrame, input: str = None, messages: list = None, is_plotting: bool = False, request_id: str = None, profile: dict = None, tools: Tools = None, semaphore: asyncio.Semaphore = None, on_event=None, tenant: str = None, history: History = None):
+    """
+    Run the main agent to an answer within MAIN_BUDGET; returns (answer, cost, is_plotting, request_id).
+    With on_event, model output is streamed and every agent's progress is reported as events.
+    tenant (the user) scopes the completion cache; replayed completions cost nothing.
+    history (earlier turns of the conversation and their running summary) goes between the
+    system prompt and input.
+    """
     if request_id is None:
         request_id = str(uuid4())
+    if semaphore is None:
+        # Caps the analysis tools running at once across every analysis run of this request
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOL_CALLS)
 
-    main_agent = MainAgent(df, request_id)
+    main_agent = MainAgent(df, request_id, profile=profile, tools=tools)
     enriched_prompt = await main_agent.get_enriched_prompt(PROMPT_ANALYSIS)
-    enriched_prompt_main = await main_agent.get_enriched_prompt(PROMPT_MAIN)
-    
-    FUNC_MAPPER = {
-        "run_analysis_agent": partial(run_analysis_agent, df=df, req_id=request_id, prompt=enriched_prompt),
-    }
+
     if input:
         messages = [
             {
                 "role": "system",
                 "content": PROMPT_MAIN
             },
+            *(history.messages() if history is not None else []),
             {
                 "role": "user",
                 "content": input
             }
         ]
     elif messages:
-        messages = messages
+        messages = messages.copy()
     else:
         raise ValueError("No input or messages provided")
 
-    context = messages.copy()
-    response = await litellm.acompletion(
-        model = MODEL_MAIN,
-        messages = messages,
-        tools = [ANALYSIS_AGENT_TOOL],
-        tool_choice = "auto",
-        seed = 42
-    )
-
-    cost = completion_cost(completion_response=response)
-    total_cost+=cost
-
-    response_message = response.choices[0].message
-    tool_calls = response_message.tool_calls
-
-    if tool_calls is None or len(tool_calls) == 0:
-        return response_message.content, total_cost, is_plotting, request_id
-
-    if tool_calls is not None and len(tool_calls) > 0:
-        context.append(response_message)
-        for tool_call in tool_calls:
-            import json
-            print(f"Calling function: {tool_call.function.name}")
-            print(f"Arguments: {tool_call.function.arguments}")
-            
-            args = json.loads(tool_call.function.arguments) if isinstance(tool_call.function.arguments, str) else tool_call.function.arguments
-            function = FUNC_MAPPER[tool_call.function.name]
-            result, cost_nested, plot_what = await function(**args)
-            is_plotting = plot_what
-            total_cost += cost_nested
-            context.append({
-                "tool_call_id": tool_call.id,
-                "role": "tool",
-                "name": tool_call.function.name,
-                "content": str(result)
-            })
-
-    final_result, cost_nested, is_plotting_nested, _ = await run_main_agent(df, messages=context, is_plotting=is_plotting, request_id=request_id)
-    is_plotting = is_plotting_nested
-    total_cost+=cost_nested
+    # Analysis runs don't take a slot themselves, their tool calls do (no nested waits on the cap)
+    func_mapper = {}
+    runner = MainRunner(func_mapper, MAIN_BUDGET, on_event=on_event, tenant=tenant, is_plotting=is_plotting)
+    # Analysis runs share the request's deadline, so they wrap up before the main run has to
+    func_mapper["run_analysis_agent"] = partial(run_analysis_agent, df=df, req_id=request_id, prompt=enriched_prompt, tools=main_agent.analysis.tools, semaphore=semaphore, deadline=runner.deadline, on_event=on_event, tenant=tenant)
+    final_result = await runner.run(messages)
     if final_result is None:
         raise ValueError("No result from the main agent")
-    return final_result, total_cost, is_plotting, request_id
+    return final_result, runner.total_cost, runner.is_plotting, request_id
 
 if __name__ == "__main__":
-    import asyncio
     data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "data.csv")
     df = pl.read_csv(data_path)
     result = asyncio.run(run_main_agent(df, input="Plot me my food vs shopping spends on a bar graph"))
@@ -0,0 +1,152 @@
+import asyncio
+import time
+import litellm
+from litellm import completion_cost
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from logger import agent_logger
+from agents.compaction import estimate_tokens
+from metrics import agent_llm_calls_total, agent_llm_duration_seconds, agent_llm_cost_total, agent_errors_total
+
+SUMMARY_PROMPT = """You maintain the running summary of a data analysis conversation about one uploaded CSV file.
+Update the existing summary with the new turns below and return only the updated summary.
+
+Keep everything a later question could reuse without querying the data again:
+- exact column names and exact values discovered (categories, merchants, names), quoted as in the data
+- filters, groupings and definitions the user settled on, and the SQL conditions that implement them
+- numbers and findings already answered, with what they refer to
+- the user's stated preferences (units, periods, chart types)
+Drop pleasantries and anything superseded by a later turn. Use terse bullet points, at most {max_words} words.
+
+EXISTING SUMMARY:
+{summary}
+
+NEW TURNS:
+{turns}
+"""
+
+
+@dataclass
+class MemoryPolicy:
+    """How much of a conversation the main agent sees: recent turns verbatim, older ones summarized"""
+    keep_turns: int = 4
+    max_history_tokens: int = 6000
+    summary_words: int = 300
+    max_queries_per_turn: int = 10
+    # Turns folded into the summary per model call when catching up on a backlog
+    fold_batch_turns: int = 8
+
+    @classmethod
+    def from_config(cls, config: dict) -> "MemoryPolicy":
+        return cls(
+            keep_turns=config.get('keep_turns', 4),
+            max_history_tokens=config.get('max_history_tokens', 6000),
+            summary_words=config.get('summary_words', 300),
+            max_queries_per_turn=config.get('max_queries_per_turn', 10),
+            fold_batch_turns=config.get('fold_batch_turns', 8)
+        )
+
+
+@dataclass
+class Turn:
+    """A question and its answer, with the SQL that produced the answer"""
+    question: str
+    answer: str = None
+    queries: list = field(default_factory=list)
+    started_at: datetime = None
+    # Time of the turn's last message; the summary covers everything up to it once folded in
+    ended_at: datetime = None
+
+    def render(self, max_queries: int) -> list:
+        answer = self.answer
+        if self.queries:
+            queries = "\n".join(f"- {q}" for q in self.queries[:max_queries])
+            answer += f"\n\n[SQL behind this answer]\n{queries}"
+        return [{"role": "user", "content": self.question}, {"role": "assistant", "content": answer}]
+
+
+@dataclass
+class History:
+    """What the main agent sees of a conversation before the new question"""
+    summary: str = None
+    turns: list = field(default_factory=list)
+    max_queries: int = 10
+
+    def messages(self) -> list:
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        for turn in self.turns:
+            messages.extend(turn.render(self.max_queries))
+        return messages
+
+
+def group_turns(messages: list) -> list:
+    """
+    Pair stored messages (oldest first; anything with role, content, created_at and queries)
+    into answered turns. Questions without an answer, e.g. failed or still running requests,
+    are left out, and so is an answer whose question isn't among messages.
+    """
+    turns = []
+    current = None
+    for message in messages:
+        if message.role == "user":
+            current = Turn(question=message.content, started_at=message.created_at, ended_at=message.created_at)
+        elif current is not None:
+            current.answer = message.content
+            current.queries = list(message.queries or [])
+            current.ended_at = message.created_at
+            turns.append(current)
+            current = None
+    return turns
+
+
+def split_window(turns: list, policy: MemoryPolicy, extra_turns: int = 0) -> tuple[list, list]:
+    """
+    Split turns (oldest first) into (older, recent): recent is the newest keep_turns (plus
+    extra_turns) turns that fit max_history_tokens together, older is what has to be folded
+    into the summary.
+    """
+    recent = []
+    tokens = 0
+    for turn in reversed(turns):
+        if len(recent) >= policy.keep_turns + extra_turns:
+            break
+        turn_tokens = estimate_tokens(turn.render(policy.max_queries_per_turn))
+        if tokens + turn_tokens > policy.max_history_tokens:
+            break
+        recent.insert(0, turn)
+        tokens += turn_tokens
+    return turns[:len(turns) - len(recent)], recent
+
+
+async def summarize_turns(summary: str, turns: list, model: str, policy: MemoryPolicy, timeout: float = 60) -> tuple[str, float]:
+    """
+    Fold turns into the running summary with one model call; only the new turns are sent
+    alongside the existing summary, so the cost doesn't grow with the conversation.
+    Returns (updated summary, cost).
+    """
+    rendered = "\n\n".join(
+        f"USER: {m['content']}" if m["role"] == "user" else f"ASSISTANT: {m['content']}"
+        for turn in turns for m in turn.render(policy.max_queries_per_turn)
+    )
+    prompt = SUMMARY_PROMPT.format(max_words=policy.summary_words, summary=summary or "(none yet)", turns=rendered)
+    started = time.monotonic()
+    try:
+        async with asyncio.timeout(timeout):
+            response = await litellm.acompletion(model=model, messages=[{"role": "user", "content": prompt}])
+    except Exception as e:
+        agent_llm_calls_total.labels(model=model, status="failed").inc()
+        agent_errors_total.labels(agent_type="memory", error_type=type(e).__name__).inc()
+        raise
+    elapsed = time.monotonic() - started
+    cost = completion_cost(completion_response=response)
+    agent_llm_calls_total.labels(model=model, status="success").inc()
+    agent_llm_duration_seconds.labels(model=model).observe(elapsed)
+    agent_llm_cost_total.labels(model=model).inc(cost)
+    agent_logger.info(
+        "Conversation summary updated",
+        extra={"turns": len(turns), "duration_seconds": round(elapsed, 3), "cost": cost}
+    )
+    return (response.choices[0].message.content or "").strip(), cost
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import time
+import litellm
+from litellm import completion_cost
+from dataclasses import dataclass, field, asdict
+
+from logger import agent_logger
+from agents.completion_cache import CompletionCache, completion_cache
+from agents.compaction import CompactionPolicy, compact_messages
+from metrics import (
+    agent_llm_calls_total,
+    agent_llm_duration_seconds,
+    agent_llm_cost_total,
+    agent_llm_prompt_tokens_total,
+    agent_llm_cache_hits_total,
+    agent_llm_cache_misses_total,
+    agent_llm_cache_saved_cost_total,
+    agent_tool_calls_total,
+    agent_execution_duration_seconds,
+    agent_errors_total,
+    agent_step_duration_seconds,
+    agent_budget_exhausted_total,
+    agent_context_tokens_saved
+)
+
+# Tool rounds may overrun the deadline by this much, so nested agents (which share the
+# deadline) get to return their own partial answers instead of being cancelled
+TOOL_ROUND_GRACE_SECONDS = 5
+
+SEED = 42
+
+# Cache breakpoint after the system prompt: tools and system prompt form the stable prefix of
+# every call (litellm only injects it for providers that support cache_control)
+CACHE_CONTROL_POINTS = [{"location": "message", "role": "system"}]
+
+BUDGET_NAMES = {"max_steps": "step", "max_tokens": "token", "max_cost_usd": "cost", "max_seconds": "time"}
+
+WRAP_UP_PROMPT = (
+    "You have run out of budget for this request ({reason}) and can't call any more tools. "
+    "Answer now using only what you have found so far. Say briefly what is still missing."
+)
+
+
+async def run_tool_calls(tool_calls: list, func_mapper: dict, semaphore: asyncio.Semaphore = None, on_event=None) -> list:
+    """
+    Run one assistant turn's tool calls concurrently, at most semaphore's worth at a time.
+    Results come back in the order of tool_calls; a call that raises yields its exception
+    instead of cancelling the others. on_event receives tool_started/tool_finished events.
+    """
+    async def call(function, args):
+        if semaphore is None:
+            return await function(**args)
+        async with semaphore:
+            return await function(**args)
+
+    async def run_one(tool_call):
+        agent_logger.debug("Calling tool", extra={"tool": tool_call.function.name, "arguments": tool_call.function.arguments})
+        function = func_mapper[tool_call.function.name]
+        args = json.loads(tool_call.function.arguments) if isinstance(tool_call.function.arguments, str) else tool_call.function.arguments
+        if on_event is None:
+            return await call(function, args)
+        event = {"tool": tool_call.function.name, "call_id": tool_call.id}
+        on_event({"type": "tool_started", **event})
+        started = time.monotonic()
+        status = "failed"
+        try:
+            result = await call(function, args)
+            status = "failed" if isinstance(result, dict) and result.get("status") == "failed" else "success"
+            return result
+        finally:
+            on_event({"type": "tool_finished", **event, "status": status, "duration_seconds": round(time.monotonic() - started, 3)})
+
+    return await asyncio.gather(*(run_one(tool_call) for tool_call in tool_calls), return_exceptions=True)
+
+
+@dataclass
+class Budget:
+    """Limits for one agent run; None disables a limit. Cost includes nested agents' cost"""
+    max_steps: int = None
+    max_tokens: int = None
+    max_cost_usd: float = None
+    max_seconds: float = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Budget":
+        return cls(
+            max_steps=config.get('max_steps'),
+            max_tokens=config.get('max_tokens'),
+            max_cost_usd=config.get('max_cost_usd'),
+            max_seconds=config.get('max_seconds')
+        )
+
+
+@dataclass
+class StepRecord:
+    step: int
+    llm_seconds: float = 0.0
+    tools_seconds: float = 0.0
+    cost: float = 0.0
+    tokens: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    cache_hit: bool = False
+    compacted_tokens: int = 0
+    tool_calls: list = field(default_factory=list)
+
+
+class AgentRunner():
+    """
+    Iterative tool-calling loop under a Budget: ask the model, run the tool calls of its turn,
+    repeat until it answers. When a budget runs out the model gets one last call without tools
+    to answer from what it has (or, if time is up, the run returns a partial answer directly).
+    Subclasses turn tool results into message content via tool_content().
+    With on_event set, model output is streamed and progress is reported as events
+    (step_started, token, tool_started, tool_finished, step_finished, budget_exhausted);
+    on_event is called on the event loop and must not block.
+    """
+
+    def __init__(self, agent_type: str, model: str, tools: list, func_mapper: dict, budget: Budget, deadline: float = None, semaphore: asyncio.Semaphore = None, on_event=None, cache_control: bool = True, tenant: str = None, compaction: CompactionPolicy = None):
+        self.agent_type = agent_type
+        self.model = model
+        self.tools = tools
+        self.func_mapper = func_mapper
+        self.budget = budget
+        self.semaphore = semaphore
+        self.on_event = on_event
+        self.cache_control = cache_control
+        # Completions are replayed from completion_cache (if enabled) only within a tenant
+        self.tenant = tenant
+        self.compaction = compaction
+        self.started = time.monotonic()
+        own_deadline = self.started + budget.max_seconds if budget.max_seconds else None
+        self.deadline = min(d for d in (own_deadline, deadline) if d is not None) if (own_deadline or deadline) else None
+        self.total_cost = 0.0
+        self.total_tokens = 0
+        self.steps: list[StepRecord] = []
+        self.exhausted = None
+        # Best answer so far for a partial reply, set by subclasses from tool results
+        self.partial = None
+
+    def remaining_seconds(self) -> float:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def emit(self, event: dict) -> None:
+        if self.on_event is not None:
+            self.on_event({"agent": self.agent_type, **event})
+
+    def tool_content(self, tool_call, result) -> str:
+        """Message content for a tool result; exceptions arrive already converted to error dicts"""
+        return str(result)
+
+    def _exhausted_budget(self) -> str:
+        if self.budget.max_steps is not None and len(self.steps) >= self.budget.max_steps:
+            return "max_steps"
+        if self.budget.max_tokens is not None and self.total_tokens >= self.budget.max_tokens:
+            return "max_tokens"
+        if self.budget.max_cost_usd is not None and self.total_cost >= self.budget.max_cost_usd:
+            return "max_cost_usd"
+        remaining = self.remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            return "max_seconds"
+        return None
+
+    async def _complete(self, messages: list, step: StepRecord, tool_choice: str = "auto"):
+        if self.compaction is not None:
+            step.compacted_tokens += compact_messages(messages, self.compaction)
+        started = time.monotonic()
+        cache_key = None
+        if completion_cache is not None and self.tenant is not None:
+            cache_key = CompletionCache.key(self.model, messages, self.tools, tool_choice, SEED)
+            cached = await asyncio.to_thread(completion_cache.get, self.tenant, cache_key)
+            if cached is not None:
+                return self._replay(*cached, step, started)
+            agent_llm_cache_misses_total.labels(model=self.model, agent_type=self.agent_type).inc()
+        try:
+            async with asyncio.timeout(self.remaining_seconds()):
+                if self.on_event is None:
+                    response = await litellm.acompletion(**self._completion_kwargs(messages, tool_choice))
+                else:
+                    response = await self._stream_completion(messages, step, tool_choice)
+        except Exception:
+            agent_llm_calls_total.labels(model=self.model, status="failed").inc()
+            raise
+        elapsed = time.monotonic() - started
+        cost = completion_cost(completion_response=response)
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "total_tokens", 0) or 0
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = min(getattr(details, "cached_tokens", 0) or 0, prompt_tokens)
+        step.llm_seconds += elapsed
+        step.cost += cost
+        step.tokens += tokens
+        step.prompt_tokens += prompt_tokens
+        step.cached_tokens += cached_tokens
+        self.total_cost += cost
+        self.total_tokens += tokens
+        agent_llm_calls_total.labels(model=self.model, status="success").inc()
+        agent_llm_prompt_tokens_total.labels(model=self.model, cache="hit").inc(cached_tokens)
+        agent_llm_prompt_tokens_total.labels(model=self.model, cache="miss").inc(prompt_tokens - cached_tokens)
+        agent_llm_duration_seconds.labels(model=self.model).observe(elapsed)
+        agent_llm_cost_total.labels(model=self.model).inc(cost)
+        if cache_key is not None:
+            try:
+                await asyncio.to_thread(completion_cache.put, self.tenant, cache_key, response, cost)
+            except OSError as e:
+                agent_logger.warning("Failed to store completion", extra={"agent_type": self.agent_type, "error": str(e)})
+        return response.choices[0].message
+
+    def _replay(self, response, original_cost: float, step: StepRecord, started: float):
+        """A cached completion: costs nothing, its tokens still count toward the budget"""
+        message = response.choices[0].message
+        if message.content:
+            self.emit({"type": "token", "step": step.step, "text": message.content})
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "total_tokens", 0) or 0
+        step.llm_seconds += time.monotonic() - started
+        step.tokens += tokens
+        step.cache_hit = True
+        self.total_tokens += tokens
+        agent_llm_calls_total.labels(model=self.model, status="cached").inc()
+        agent_llm_cache_hits_total.labels(model=self.model, agent_type=self.agent_type).inc()
+        agent_llm_cache_saved_cost_total.labels(model=self.model).inc(original_cost)
+        return message
+
+    def _completion_kwargs(self, messages: list, tool_choice: str) -> dict:
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "tools": self.tools,
+            "tool_choice": tool_choice,
+            "seed": SEED
+        }
+        if self.cache_control:
+            kwargs["cache_control_injection_points"] = CACHE_CONTROL_POINTS
+        return kwargs
+
+    async def _stream_completion(self, messages: list, step: StepRecord, tool_choice: str):
+        """Stream the completion, emitting content tokens, and rebuild the full response"""
+        stream = await litellm.acompletion(
+            **self._completion_kwargs(messages, tool_choice),
+            stream = True,
+            stream_options = {"include_usage": True}
+        )
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                self.emit({"type": "token", "step": step.step, "text": chunk.choices[0].delta.content})
+        return litellm.stream_chunk_builder(chunks, messages=messages)
+
+    async def _run_tools(self, tool_calls: list, step: StepRecord) -> list:
+        started = time.monotonic()
+        remaining = self.remaining_seconds()
+        on_event = None if self.on_event is None else lambda event: self.emit({**event, "step": step.step})
+        async with asyncio.timeout(None if remaining is None else remaining + TOOL_ROUND_GRACE_SECONDS):
+            results = await run_tool_calls(tool_calls, self.func_mapper, self.semaphore, on_event=on_event)
+        step.tools_seconds += time.monotonic() - started
+        contents = []
+        for tool_call, result in zip(tool_calls, results):
+            step.tool_calls.append(tool_call.function.name)
+            failed = isinstance(result, Exception) or (isinstance(result, dict) and result.get("status") == "failed")
+            agent_tool_calls_total.labels(tool=tool_call.function.name, status="failed" if failed else "success").inc()
+            if isinstance(result, Exception):
+                result = {"error": f"{type(result).__name__}: {str(result)}", "status": "failed"}
+            contents.append(self.tool_content(tool_call, result))
+        return contents
+
+    def _partial_answer(self, reason: str, last_content: str) -> str:
+        last_content = last_content or self.partial
+        message = f"I couldn't finish this analysis within its {BUDGET_NAMES[reason]} budget."
+        if last_content and message in last_content:
+            return last_content
+        if last_content:
+            return f"{last_content}\n\n({message})"
+        return message + " Try a narrower question."
+
+    async def run(self, messages: list) -> str:
+        """Run the loop on messages (extended in place) and return the final answer"""
+        last_content = None
+        try:
+            while True:
+                self.exhausted = self._exhausted_budget()
+                if self.exhausted:
+                    break
+                step = StepRecord(step=len(self.steps) + 1)
+                self.steps.append(step)
+                self.emit({"type": "step_started", "step": step.step})
+                try:
+                    response_message = await self._complete(messages, step)
+                    tool_calls = response_message.tool_calls
+                    if not tool_calls:
+                        return response_message.content
+                    last_content = response_message.content or last_content
+                    messages.append(response_message)
+                    contents = await self._run_tools(tool_calls, step)
+                except TimeoutError:
+                    self.exhausted = "max_seconds"
+                    break
+                finally:
+                    agent_step_duration_seconds.labels(agent_type=self.agent_type).observe(step.llm_seconds + step.tools_seconds)
+                    self.emit({"type": "step_finished", **asdict(step)})
+                messages.extend(
+                    {
+                        "tool_call_id": tool_call.id,
+                        "role": "tool",
+                        "name": tool_call.function.name,
+                        "content": content
+                    }
+                    for tool_call, content in zip(tool_calls, contents)
+                )
+
+            agent_budget_exhausted_total.labels(agent_type=self.agent_type, budget=self.exhausted).inc()
+            self.emit({"type": "budget_exhausted", "budget": self.exhausted})
+            if self.exhausted == "max_seconds":
+                return self._partial_answer(self.exhausted, last_content)
+            messages.append({"role": "user", "content": WRAP_UP_PROMPT.format(reason=f"{BUDGET_NAMES[self.exhausted]} limit")})
+            step = StepRecord(step=len(self.steps) + 1)
+            self.steps.append(step)
+            self.emit({"type": "step_started", "step": step.step})
+            try:
+                response_message = await self._complete(messages, step, tool_choice="none")
+            except TimeoutError:
+                return self._partial_answer(self.exhausted, last_content)
+            finally:
+                self.emit({"type": "step_finished", **asdict(step)})
+            return response_message.content or self._partial_answer(self.exhausted, last_content)
+        except Exception as e:
+            agent_errors_total.labels(agent_type=self.agent_type, error_type=type(e).__name__).inc()
+            raise
+        finally:
+            elapsed = time.monotonic() - self.started
+            agent_execution_duration_seconds.labels(agent_type=self.agent_type).observe(elapsed)
+            tokens_saved = sum(step.compacted_tokens for step in self.steps)
+            agent_context_tokens_saved.labels(agent_type=self.agent_type).observe(tokens_saved)
+            agent_logger.info(
+                "Agent run finished",
+                extra={
+                    "agent_type": self.agent_type,
+                    "duration_seconds": round(elapsed, 3),
+                    "cost": self.total_cost,
+                    "tokens": self.total_tokens,
+                    "cached_tokens": sum(step.cached_tokens for step in self.steps),
+                    "cached_completions": sum(step.cache_hit for step in self.steps),
+                    "compacted_tokens": tokens_saved,
+                    "budget_exhausted": self.exhausted,
+                    "steps": [asdict(step) for step in self.steps]
+                }
+            )
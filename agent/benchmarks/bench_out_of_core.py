@@ -0,0 +1,117 @@
+"""
+Peak RSS of the request worker for eager vs out-of-core queries on a large synthetic dataset.
+
+    python agent/benchmarks/bench_out_of_core.py --gb 5
+
+Each mode runs in a fresh interpreter and reports its own VmHWM, since ru_maxrss survives exec
+on Linux. For the out-of-core mode the query itself runs in a child process, whose peak is
+reported separately.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+import polars as pl
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+QUERIES = [
+    "SELECT category, COUNT(*) AS n, SUM(amount) AS total FROM self GROUP BY category",
+    "SELECT merchant, AVG(amount) AS avg_amount FROM self WHERE amount > 900 GROUP BY merchant ORDER BY avg_amount DESC LIMIT 10",
+]
+
+ROWS_PER_PART = 5_000_000
+
+
+def generate(path: str, target_gb: float):
+    """Write Parquet parts until the dataset's in-memory size reaches target_gb"""
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(42)
+    merchants = np.array([f"merchant_{i:05d}" for i in range(20000)])
+    categories = np.array(["food", "shopping", "travel", "bills", "health", "fun"])
+    written = 0
+    part = 0
+    while written < target_gb * 1024 ** 3:
+        df = pl.DataFrame({
+            "id": np.arange(part * ROWS_PER_PART, (part + 1) * ROWS_PER_PART),
+            "merchant": merchants[rng.integers(0, len(merchants), ROWS_PER_PART)],
+            "category": categories[rng.integers(0, len(categories), ROWS_PER_PART)],
+            "amount": rng.random(ROWS_PER_PART) * 1000,
+            "ts": rng.integers(1_600_000_000, 1_700_000_000, ROWS_PER_PART),
+        })
+        df.write_parquet(os.path.join(path, f"part-{part:04d}.parquet"), compression="zstd")
+        written += df.estimated_size()
+        part += 1
+        print(f"  part {part}: {written / 1024 ** 3:.2f} GB in memory terms", file=sys.stderr)
+
+
+def peak_rss_mb() -> int:
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) // 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+def run_mode(mode: str, path: str):
+    """Executed in a fresh interpreter: run all queries and print peak RSS as JSON"""
+    import multiprocessing as mp
+    from tools import out_of_core
+    from tools.tools import Tools, query_workers
+
+    # Query processes become direct children so RUSAGE_CHILDREN covers them
+    out_of_core._mp_context = lambda: mp.get_context("spawn")
+
+    source = os.path.join(path, "*.parquet")
+    start = time.perf_counter()
+    if mode == "eager":
+        tools = Tools(pl.read_parquet(source))
+    else:
+        tools = Tools(pl.scan_parquet(source), out_of_core=True)
+    for query in QUERIES:
+        result = tools.sql(query)
+        if isinstance(result, dict):
+            raise RuntimeError(result["error"])
+    # Reap the warm query workers so their peak is counted
+    query_workers.close()
+    print(json.dumps({
+        "mode": mode,
+        "seconds": round(time.perf_counter() - start, 2),
+        "worker_peak_rss_mb": peak_rss_mb(),
+        "query_process_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gb", type=float, default=5.0)
+    parser.add_argument("--path", default="/tmp/blinq_bench_out_of_core")
+    parser.add_argument("--modes", default="out_of_core,eager")
+    parser.add_argument("--run-mode")
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_mode(args.run_mode, args.path)
+        return
+
+    if not os.path.exists(args.path):
+        print(f"Generating ~{args.gb} GB synthetic dataset at {args.path}", file=sys.stderr)
+        generate(args.path, args.gb)
+
+    for mode in args.modes.split(","):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--path", args.path, "--run-mode", mode],
+            capture_output=True, text=True
+        )
+        if proc.returncode == 0:
+            print(proc.stdout.strip().splitlines()[-1])
+        else:
+            print(json.dumps({"mode": mode, "failed": f"exit code {proc.returncode}", "stderr": proc.stderr.strip()[-300:]}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+CPU time and bytes on the wire per plot for the old base64 plot path vs the binary one.
+
+    python agent/benchmarks/bench_plot_payload.py --points 5000
+
+before: PNG -> base64 in plot() -> decoded to store -> read back and base64-encoded into the
+        analysis JSON response.
+after:  PNG stored as-is; the analysis response carries plot_url and the client fetches the raw
+        PNG from /api/plots/{request_id}.
+Blob storage writes/reads are the same in both paths and are left out.
+"""
+import argparse
+import base64
+import io
+import json
+import time
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+RESPONSE = {
+    "response": "Here is the chart of monthly spend by category.",
+    "is_plotting": True,
+    "cost": 0.0123,
+    "request_id": "5b0c1e0e-0e0f-4a4e-9d55-7b1d2f4f6a11",
+    "message_id": "c1f5a9d2-8f6c-4d2b-a1d3-2e9c8b7a6f54",
+    "status": "success",
+    "plot_status": "ready"
+}
+
+
+def render_png(points: int) -> bytes:
+    rng = np.random.default_rng(42)
+    fig, ax = plt.subplots()
+    ax.scatter(rng.normal(size=points), rng.normal(size=points), s=4, alpha=0.5)
+    ax.set_title("benchmark")
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=150)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def before(png: bytes) -> int:
+    image_bytes = base64.b64encode(png).decode("utf-8")
+    stored = base64.b64decode(image_bytes)
+    body = dict(RESPONSE, plot_image=base64.b64encode(stored).decode("utf-8"))
+    return len(json.dumps(body).encode())
+
+
+def after(png: bytes) -> int:
+    body = dict(RESPONSE, plot_url=f"/api/plots/{RESPONSE['request_id']}")
+    return len(json.dumps(body).encode()) + len(png)
+
+
+def measure(fn, png: bytes, iterations: int) -> tuple[float, int]:
+    started = time.process_time()
+    for _ in range(iterations):
+        wire = fn(png)
+    return (time.process_time() - started) / iterations, wire
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    png = render_png(args.points)
+    print(f"PNG: {len(png) / 1024:.1f} KB")
+    for name, fn in (("before", before), ("after", after)):
+        cpu, wire = measure(fn, png, args.iterations)
+        print(f"{name:>6}: {cpu * 1000:.3f} ms CPU/plot, {wire / 1024:.1f} KB on the wire")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,13 @@ import os
 from pythonjsonlogger import jsonlogger
 from logging.handlers import RotatingFileHandler
 
+class _MergingAdapter(logging.LoggerAdapter):
+    """Keep the caller's extra fields alongside the adapter's (LoggerAdapter replaces them)"""
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
 def setup_agent_logger():
     logger = logging.getLogger("agent")
     log_level = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -41,6 +48,6 @@ def setup_agent_logger():
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
 
-    return logging.LoggerAdapter(logger, {"service": "agent"})
+    return _MergingAdapter(logger, {"service": "agent"})
 
 agent_logger = setup_agent_logger()
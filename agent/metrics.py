@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Histogram, Gauge
 
 agent_llm_calls_total = Counter(
     'agent_llm_calls_total',
@@ -19,6 +19,36 @@ agent_llm_cost_total = Counter(
     ['model']
 )
 
+agent_llm_prompt_tokens_total = Counter(
+    'agent_llm_prompt_tokens_total',
+    'Total LLM input tokens, by whether the provider served them from its prompt cache',
+    ['model', 'cache']
+)
+
+agent_llm_cache_hits_total = Counter(
+    'agent_llm_cache_hits_total',
+    'Total LLM completions replayed from the completion cache',
+    ['model', 'agent_type']
+)
+
+agent_llm_cache_misses_total = Counter(
+    'agent_llm_cache_misses_total',
+    'Total LLM completions not found in the completion cache',
+    ['model', 'agent_type']
+)
+
+agent_llm_cache_saved_cost_total = Counter(
+    'agent_llm_cache_saved_cost_total',
+    'Total USD the completion cache saved (original cost of replayed completions)',
+    ['model']
+)
+
+agent_llm_cache_evictions_total = Counter(
+    'agent_llm_cache_evictions_total',
+    'Total completion cache entries removed',
+    ['reason']
+)
+
 agent_sql_queries_total = Counter(
     'agent_sql_queries_total',
     'Total SQL queries executed',
@@ -56,8 +86,50 @@ agent_execution_duration_seconds = Histogram(
     buckets=[1.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0]
 )
 
+agent_step_duration_seconds = Histogram(
+    'agent_step_duration_seconds',
+    'Agent loop step duration (model call plus tool calls) in seconds',
+    ['agent_type'],
+    buckets=[0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0]
+)
+
+agent_budget_exhausted_total = Counter(
+    'agent_budget_exhausted_total',
+    'Total agent runs stopped by a budget',
+    ['agent_type', 'budget']
+)
+
+agent_context_tokens_saved = Histogram(
+    'agent_context_tokens_saved',
+    'Estimated input tokens per agent run saved by compacting consumed tool outputs',
+    ['agent_type'],
+    buckets=[0, 1000, 5000, 10000, 25000, 50000, 100000, 250000]
+)
+
 agent_errors_total = Counter(
     'agent_errors_total',
     'Total agent errors',
     ['agent_type', 'error_type']
 )
+
+agent_sql_cache_hits_total = Counter(
+    'agent_sql_cache_hits_total',
+    'Total SQL result cache hits',
+    ['tier']
+)
+
+agent_sql_cache_misses_total = Counter(
+    'agent_sql_cache_misses_total',
+    'Total SQL result cache misses'
+)
+
+agent_sql_cache_evictions_total = Counter(
+    'agent_sql_cache_evictions_total',
+    'Total SQL result cache evictions',
+    ['reason']
+)
+
+agent_sql_cache_bytes = Gauge(
+    'agent_sql_cache_bytes',
+    'Bytes of Arrow results held in the in-memory SQL result cache'
+)
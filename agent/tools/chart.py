@@ -0,0 +1,125 @@
+import io
+from datetime import date, datetime, time
+import polars as pl
+
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+MARKS = ("bar", "line", "point", "area")
+CHANNELS = ("x", "y", "color")
+FIELD_TYPES = ("quantitative", "nominal", "ordinal", "temporal")
+
+
+class ChartSpecError(ValueError):
+    """Raised when a chart spec is not in the supported Vega-Lite subset"""
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def build_chart_spec(data: pl.DataFrame, mark, encoding: dict, title: str = None, max_points: int = 5000) -> dict:
+    """
+    Validate a chart against the supported Vega-Lite subset and inline its data.
+    mark is one of MARKS (or {"type": mark}); encoding maps x, y and optionally color to
+    {"field", "type", "title"}, where fields are columns of data (an already aggregated SQL result).
+    """
+    mark_type = mark.get("type") if isinstance(mark, dict) else mark
+    if mark_type not in MARKS:
+        raise ChartSpecError(f"Unsupported mark '{mark_type}'. Use one of {list(MARKS)}.")
+    if not isinstance(encoding, dict):
+        raise ChartSpecError("encoding must be an object with x, y and optionally color.")
+    unknown = [c for c in encoding if c not in CHANNELS]
+    if unknown:
+        raise ChartSpecError(f"Unsupported encoding channels {unknown}. Use {list(CHANNELS)}.")
+    if "x" not in encoding or "y" not in encoding:
+        raise ChartSpecError("encoding needs both x and y.")
+    if data.height == 0:
+        raise ChartSpecError("The chart query returned no rows.")
+    if data.height > max_points:
+        raise ChartSpecError(f"The chart query returned {data.height} rows; charts take at most {max_points}. Aggregate or add a LIMIT.")
+
+    normalized = {}
+    for channel, definition in encoding.items():
+        if not isinstance(definition, dict) or "field" not in definition:
+            raise ChartSpecError(f"encoding.{channel} must be an object with a field.")
+        field = definition["field"]
+        if field not in data.columns:
+            raise ChartSpecError(f"encoding.{channel}.field '{field}' is not a column of the query result {data.columns}.")
+        dtype = data.schema[field]
+        field_type = definition.get("type") or ("quantitative" if dtype.is_numeric() else "temporal" if dtype.is_temporal() else "nominal")
+        if field_type not in FIELD_TYPES:
+            raise ChartSpecError(f"encoding.{channel}.type must be one of {list(FIELD_TYPES)}.")
+        if field_type == "quantitative" and not dtype.is_numeric():
+            raise ChartSpecError(f"encoding.{channel} is quantitative but column '{field}' is {dtype}.")
+        normalized[channel] = {"field": field, "type": field_type, "title": definition.get("title") or field}
+
+    if normalized["y"]["type"] != "quantitative":
+        raise ChartSpecError("encoding.y must be quantitative (put categories on x).")
+
+    fields = list(dict.fromkeys(d["field"] for d in normalized.values()))
+    spec = {
+        "$schema": VEGA_LITE_SCHEMA,
+        "mark": {"type": mark_type},
+        "encoding": normalized,
+        "data": {"values": [{k: _jsonable(v) for k, v in row.items()} for row in data.select(fields).iter_rows(named=True)]}
+    }
+    if title:
+        spec["title"] = title
+    return spec
+
+
+def render_chart_png(spec: dict, dpi: int = 150) -> bytes:
+    """
+    Server-side PNG of a validated spec, for exports and clients that can't render specs.
+    Uses matplotlib's object API (no pyplot state), so it is safe to call from any thread.
+    """
+    from matplotlib.figure import Figure
+
+    encoding = spec["encoding"]
+    mark = spec["mark"]["type"]
+    frame = pl.DataFrame(spec["data"]["values"], infer_schema_length=None)
+    x, y = encoding["x"], encoding["y"]
+    color = encoding.get("color")
+
+    fig = Figure(figsize=(8, 5))
+    ax = fig.add_subplot()
+    groups = frame.partition_by(color["field"], maintain_order=True, as_dict=True) if color else {(None,): frame}
+    categorical_x = x["type"] in ("nominal", "ordinal")
+    categories = frame[x["field"]].unique(maintain_order=True).to_list() if categorical_x else None
+    width = 0.8 / len(groups)
+
+    for i, (key, group) in enumerate(groups.items()):
+        label = None if key[0] is None else str(key[0])
+        xs = group[x["field"]].to_list()
+        ys = group[y["field"]].to_list()
+        if x["type"] == "temporal":
+            xs = group[x["field"]].cast(pl.String).str.to_datetime(strict=False).to_list()
+        if categorical_x:
+            positions = [categories.index(v) for v in xs]
+            if mark == "bar":
+                positions = [p - 0.4 + width * (i + 0.5) for p in positions]
+            xs = positions
+        if mark == "bar":
+            ax.bar(xs, ys, width=width if categorical_x else 0.8, label=label)
+        elif mark == "line":
+            ax.plot(xs, ys, marker="o", markersize=3, label=label)
+        elif mark == "area":
+            ax.fill_between(xs, ys, alpha=0.5, label=label)
+        else:
+            ax.scatter(xs, ys, s=12, label=label)
+
+    if categorical_x:
+        ax.set_xticks(range(len(categories)), [str(c) for c in categories], rotation=45 if len(categories) > 6 else 0, ha="right" if len(categories) > 6 else "center")
+    ax.set_xlabel(x["title"])
+    ax.set_ylabel(y["title"])
+    if spec.get("title"):
+        ax.set_title(spec["title"])
+    if color:
+        ax.legend(title=color["title"])
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import threading
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import agent_sql_queries_total, agent_sql_duration_seconds
+
+config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs.yaml")
+with open(config_path, "r") as f:
+    configs = yaml.safe_load(f)
+
+EXECUTOR = configs.get('tools', {}).get('executor', {})
+EXECUTOR_MAX_THREADS = EXECUTOR.get('max_threads', 4)
+EXECUTOR_TIMEOUT = EXECUTOR.get('timeout_seconds', 60)
+
+# Shared by every request in this worker, so concurrent agents can't starve the event loop's own pool
+_executor = ThreadPoolExecutor(max_workers=EXECUTOR_MAX_THREADS, thread_name_prefix="agent-sql")
+
+
+async def run_blocking(call, timeout: float = None):
+    """
+    Run call(cancel) on the bounded SQL thread pool instead of the event loop, for anything
+    that scans data (queries, index lookups and lazy index builds). Work that runs in a child
+    process (out-of-core datasets, or LazyFrame queries with lazy_queries: "process") is
+    killed when cancel is set: on timeout or when the awaiting task is cancelled, e.g.
+    because the HTTP client disconnected. In-process work can't be interrupted; its thread
+    finishes in the background and the result is discarded. A timeout returns a failed result.
+    """
+    timeout = timeout or EXECUTOR_TIMEOUT
+    cancel = threading.Event()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, call, cancel)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        cancel.set()
+        return {
+            "error": f"Query timed out after {timeout} seconds and was stopped. Filter or aggregate to touch less data, or add a LIMIT.",
+            "error_type": "timeout",
+            "timeout_seconds": timeout,
+            "status": "failed"
+        }
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+async def run_sql(tools, query: str, timeout: float = None):
+    """Run tools.sql(query) through run_blocking, recording its outcome and duration"""
+    started = time.monotonic()
+    try:
+        result = await run_blocking(lambda cancel: tools.sql(query, cancel=cancel), timeout)
+    except asyncio.CancelledError:
+        agent_sql_queries_total.labels(status="cancelled").inc()
+        raise
+    if isinstance(result, dict) and result.get("error_type") == "timeout":
+        agent_sql_queries_total.labels(status="timeout").inc()
+        return result
+    agent_sql_duration_seconds.observe(time.monotonic() - started)
+    failed = isinstance(result, dict) and result.get("status") == "failed"
+    agent_sql_queries_total.labels(status="failed" if failed else "success").inc()
+    return result
@@ -0,0 +1,73 @@
+import polars as pl
+from typing import Callable
+
+# approx_n_unique is a HyperLogLog estimate; leave headroom before ruling a column out
+HLL_MARGIN = 1.05
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def build_column_index(lf: pl.LazyFrame, collect: Callable, column: str, max_cardinality: int, estimate: int = None) -> dict:
+    """
+    Distinct values of one column with their frequencies, most frequent first.
+    Columns whose (estimated) cardinality exceeds max_cardinality only record the cardinality.
+    """
+    if estimate is None:
+        estimate = collect(lf.select(pl.col(column).approx_n_unique())).item()
+    if estimate > max_cardinality * HLL_MARGIN:
+        return {"indexed": False, "cardinality": int(estimate), "exact": False}
+
+    counts = collect(lf.group_by(column).len())
+    values = counts.filter(pl.col(column).is_not_null()).sort(["len", column], descending=[True, False])
+    null_count = int(counts.filter(pl.col(column).is_null())["len"].sum())
+    if values.height > max_cardinality:
+        return {"indexed": False, "cardinality": values.height, "exact": True}
+
+    return {
+        "indexed": True,
+        "cardinality": values.height,
+        "exact": True,
+        "null_count": null_count,
+        "values": [[_jsonable(value), count] for value, count in values.rows()]
+    }
+
+
+def build_distinct_index(lf: pl.LazyFrame, collect: Callable, max_cardinality: int) -> dict:
+    """
+    Upload-time index of distinct values per low-cardinality column, so the agent's
+    discovery step (SELECT DISTINCT ...) is answered without scanning the data.
+    """
+    columns = lf.collect_schema().names()
+    estimates = collect(lf.select([pl.col(c).approx_n_unique().alias(c) for c in columns])).row(0, named=True)
+    return {
+        column: build_column_index(lf, collect, column, max_cardinality, estimate=estimates[column])
+        for column in columns
+    }
+
+
+def page_distinct_values(entry: dict, column: str, offset: int, limit: int) -> dict:
+    """Page through an index entry, most frequent values first"""
+    if not entry["indexed"]:
+        approx = "" if entry["exact"] else "~"
+        return {
+            "column": column,
+            "indexed": False,
+            "cardinality": entry["cardinality"],
+            "message": f"Column has {approx}{entry['cardinality']} distinct values, too many to list. Use sql() with a filter or aggregation instead."
+        }
+    values = entry["values"][offset:offset + limit]
+    next_offset = offset + len(values)
+    return {
+        "column": column,
+        "indexed": True,
+        "cardinality": entry["cardinality"],
+        "null_count": entry["null_count"],
+        "offset": offset,
+        "values": [{"value": value, "count": count} for value, count in values],
+        "has_more": next_offset < entry["cardinality"],
+        "next_offset": next_offset if next_offset < entry["cardinality"] else None
+    }
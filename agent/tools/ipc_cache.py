@@ -0,0 +1,120 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+import yaml
+
+config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs.yaml")
+with open(config_path, "r") as f:
+    configs = yaml.safe_load(f)
+
+DATASET_CACHE = configs.get('plots', {}).get('dataset_cache', {})
+
+
+class IpcCache:
+    """
+    Host-wide directory of uncompressed Arrow IPC copies of datasets for plot workers to
+    memory-map, keyed by dataset content hash: plotting again on an unchanged dataset reuses
+    the file an earlier request (in any worker) wrote. Each holder keeps a shared flock on its
+    file as a reference; past max_bytes, the least recently used unreferenced files are removed.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, dataset_hash: str, write) -> tuple[str, int]:
+        """
+        Path of the dataset's IPC file, calling write(path) to create it if missing, and a file
+        descriptor holding the reference; pass it to release() once the file is no longer needed.
+        """
+        path = os.path.join(self.directory, dataset_hash + ".arrow")
+        with self._lock:
+            while True:
+                if not os.path.exists(path):
+                    self._create(path, write)
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except FileNotFoundError:
+                    continue
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                # Evicted between open and lock: the path is gone or now names a new file
+                try:
+                    current = os.stat(path).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current == os.fstat(fd).st_ino:
+                    break
+                os.close(fd)
+        # Recency for LRU eviction
+        os.utime(path)
+        return path, fd
+
+    @staticmethod
+    def release(fd: int) -> None:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    def _create(self, path: str, write) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            try:
+                # Never replaces a file another process already published (and may hold)
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(tmp_path)
+        self._enforce_budget(keep=path)
+
+    def _enforce_budget(self, keep: str) -> None:
+        """Remove the least recently used files nobody holds until the directory fits max_bytes"""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".arrow"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path != keep and self._remove_unreferenced(path):
+                total -= size
+
+    @staticmethod
+    def _remove_unreferenced(path: str) -> bool:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+
+
+# Shared by every request in this worker and, through the directory, by every worker on the host
+ipc_cache = IpcCache(
+    directory=DATASET_CACHE.get('dir', 'cache/plot_datasets'),
+    max_bytes=DATASET_CACHE.get('max_mb', 4096) * 1024 * 1024
+)
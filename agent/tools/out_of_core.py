@@ -0,0 +1,163 @@
+import multiprocessing as mp
+import os
+import pickle
+import threading
+import time
+import io
+import polars as pl
+
+
+class OutOfCoreError(Exception):
+    """Raised when an out-of-core query cannot complete within its memory/time/result limits"""
+
+
+def _mp_context():
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload(["polars"])
+        return ctx
+    return mp.get_context("spawn")
+
+
+def _rss_bytes(pid: int) -> int | None:
+    """Resident set size of a process from /proc, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _run_collect(payload: bytes, op: str, max_rows: int | None) -> tuple[str, object]:
+    """
+    Collect a pickled LazyFrame on the streaming engine and return ("ok", Arrow IPC bytes) or
+    ("error", message). A max_rows of None leaves the result size uncapped.
+    """
+    try:
+        lf = pickle.loads(payload)
+        if op == "describe":
+            result = lf.describe()
+        elif max_rows is None:
+            result = lf.collect(engine="streaming")
+        else:
+            result = lf.limit(max_rows + 1).collect(engine="streaming")
+            if result.height > max_rows:
+                return "error", f"Query returned more than {max_rows} rows. Aggregate, filter or add a LIMIT."
+        buf = io.BytesIO()
+        result.write_ipc(buf)
+        return "ok", buf.getvalue()
+    except Exception as e:
+        return "error", f"SQL Error: {str(e)}"
+
+
+def _worker_main(conn):
+    """Query worker loop: polars is imported once, then each task is collected and sent back"""
+    while True:
+        try:
+            payload, op, max_rows = conn.recv()
+        except EOFError:
+            return
+        conn.send(_run_collect(payload, op, max_rows))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.queries = 0
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class QueryWorkerPool:
+    """
+    Warm child processes for queries that run under a memory ceiling (out-of-core datasets and
+    isolated lazy queries), so a small query doesn't pay for starting a process. Each query is
+    watched from the calling thread: past its memory_limit_bytes or timeout, or once cancel is
+    set, its worker is killed and the query fails with OutOfCoreError instead of OOM-killing the
+    request worker. A worker is retired after max_queries queries, or when a finished query
+    leaves its RSS above recycle_rss_bytes, which would count against the next query's ceiling.
+    Up to idle_workers wait between queries; concurrent queries beyond that get a fresh worker
+    (the SQL thread pool bounds how many run at once).
+    """
+
+    def __init__(self, idle_workers: int, max_queries: int, recycle_rss_bytes: int):
+        self.idle_workers = idle_workers
+        self.max_queries = max_queries
+        self.recycle_rss_bytes = recycle_rss_bytes
+        self._ctx = None
+        self._idle: list[_Worker] = []
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> _Worker:
+        with self._lock:
+            if self._ctx is None:
+                self._ctx = _mp_context()
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.stop()
+            ctx = self._ctx
+        return _Worker(ctx)
+
+    def _checkin(self, worker: _Worker, healthy: bool) -> None:
+        worker.queries += 1
+        if healthy and worker.queries < self.max_queries:
+            rss = _rss_bytes(worker.process.pid)
+            if rss is None or rss <= self.recycle_rss_bytes:
+                with self._lock:
+                    if len(self._idle) < self.idle_workers:
+                        self._idle.append(worker)
+                        return
+        worker.stop()
+
+    def close(self) -> None:
+        """Stop the idle workers; the pool starts new ones if used again"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def collect(self, lf: pl.LazyFrame, memory_limit_bytes: int, max_rows: int | None, timeout: float = None, op: str = "collect", cancel: threading.Event = None) -> pl.DataFrame:
+        """Run a LazyFrame plan on the streaming engine in a worker, within memory_limit_bytes and timeout"""
+        worker = self._checkout()
+        deadline = time.monotonic() + timeout if timeout else None
+        limit_mb = memory_limit_bytes // (1024 * 1024)
+        healthy = False
+        try:
+            worker.conn.send((pickle.dumps(lf), op, max_rows))
+            while not worker.conn.poll(0.05):
+                if not worker.process.is_alive():
+                    raise OutOfCoreError(
+                        f"Query process exited unexpectedly (exit code {worker.process.exitcode}). "
+                        f"It most likely hit the {limit_mb} MB memory ceiling for large datasets."
+                    )
+                rss = _rss_bytes(worker.process.pid)
+                if rss is not None and rss > memory_limit_bytes:
+                    raise OutOfCoreError(
+                        f"Query exceeded the {limit_mb} MB memory ceiling for large datasets. "
+                        "It probably needs an operation that cannot stream (e.g. sorting, pivoting or joining the full dataset). "
+                        "Filter or aggregate first, or add a LIMIT."
+                    )
+                if deadline is not None and time.monotonic() > deadline:
+                    raise OutOfCoreError(f"Query timed out after {timeout} seconds.")
+                if cancel is not None and cancel.is_set():
+                    raise OutOfCoreError("Query was cancelled.")
+            status, data = worker.conn.recv()
+            healthy = True
+        except (EOFError, BrokenPipeError):
+            worker.process.join(1)
+            raise OutOfCoreError(f"Query process exited unexpectedly (exit code {worker.process.exitcode}).")
+        finally:
+            self._checkin(worker, healthy)
+
+        if status == "error":
+            raise OutOfCoreError(data)
+        return pl.read_ipc(io.BytesIO(data))
@@ -0,0 +1,145 @@
+import io
+import queue
+import resource
+import threading
+import time
+
+from tools.out_of_core import _mp_context, _rss_bytes
+
+
+class PlotRenderError(Exception):
+    """Raised when a plot cannot be rendered within its time/memory/CPU limits"""
+
+
+def _worker_main(conn, cpu_seconds: int):
+    """
+    Plot worker loop: matplotlib (Agg) and polars are imported once, then each task
+    memory-maps the dataset from an Arrow IPC file, runs the plotting code and sends back PNG bytes.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import polars as pl
+
+    while True:
+        try:
+            code, dataset_path, dpi = conn.recv()
+        except EOFError:
+            return
+        # CPU limit per render, counted from what this worker has already used; SIGXCPU kills it
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime) + 1
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = used + cpu_seconds
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        try:
+            env = {"df": pl.read_ipc(dataset_path, memory_map=True), "plt": plt, "io": io}
+            exec(code, env)
+
+            if 'result' not in env:
+                conn.send(("error", "Code execution completed but 'result' variable was not assigned. Make sure to assign the matplotlib figure to 'result' variable."))
+                continue
+            fig = env['result']
+            if fig is None:
+                conn.send(("error", "'result' variable is None. Make sure to assign a valid matplotlib figure object to 'result'."))
+                continue
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', bbox_inches='tight', dpi=dpi)
+            conn.send(("ok", buf.getvalue()))
+        except Exception as e:
+            conn.send(("error", str(e)))
+        finally:
+            plt.close("all")
+
+
+class _Worker:
+    def __init__(self, ctx, cpu_seconds: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, cpu_seconds), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.renders = 0
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class PlotWorkerPool:
+    """
+    Pre-forked pool of plot workers with matplotlib already imported.
+    A render that runs past timeout or whose worker's RSS passes memory_limit_bytes gets
+    its worker killed and replaced; workers are also recycled after max_renders renders
+    so leaks in user plotting code don't accumulate.
+    """
+
+    def __init__(self, size: int, max_renders: int, timeout: float, memory_limit_bytes: int, cpu_seconds: int):
+        self.size = size
+        self.max_renders = max_renders
+        self.timeout = timeout
+        self.memory_limit_bytes = memory_limit_bytes
+        self.cpu_seconds = cpu_seconds
+        self._ctx = None
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Fork the workers; called on first render if not called earlier"""
+        with self._lock:
+            if self._ctx is not None:
+                return
+            self._ctx = _mp_context()
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.cpu_seconds)
+
+    def render(self, code: str, dataset_path: str, dpi: int) -> bytes:
+        """Render plotting code against the Arrow IPC file at dataset_path and return PNG bytes"""
+        self.start()
+        deadline = time.monotonic() + self.timeout
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PlotRenderError(f"All plot workers are busy; gave up after {self.timeout} seconds.")
+
+        healthy = False
+        limit_mb = self.memory_limit_bytes // (1024 * 1024)
+        try:
+            worker.conn.send((code, dataset_path, dpi))
+            while not worker.conn.poll(0.05):
+                if not worker.process.is_alive():
+                    raise self._died(worker)
+                rss = _rss_bytes(worker.process.pid)
+                if rss is not None and rss > self.memory_limit_bytes:
+                    raise PlotRenderError(f"Plot exceeded the {limit_mb} MB memory limit. Aggregate the data before plotting.")
+                if time.monotonic() > deadline:
+                    raise PlotRenderError(f"Plot timed out after {self.timeout} seconds.")
+            try:
+                status, payload = worker.conn.recv()
+            except EOFError:
+                raise self._died(worker)
+            healthy = True
+        finally:
+            worker.renders += 1
+            if healthy and worker.renders < self.max_renders:
+                self._idle.put(worker)
+            else:
+                worker.stop()
+                self._idle.put(self._spawn())
+
+        if status == "error":
+            raise PlotRenderError(payload)
+        return payload
+
+    def _died(self, worker: _Worker) -> PlotRenderError:
+        worker.process.join(1)
+        return PlotRenderError(
+            f"Plot worker exited unexpectedly (exit code {worker.process.exitcode}). "
+            f"It most likely hit the {self.cpu_seconds}s CPU limit."
+        )
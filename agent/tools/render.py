@@ -0,0 +1,67 @@
+import polars as pl
+
+
+def _to_text(df: pl.DataFrame, fmt: str) -> str:
+    if fmt == "markdown":
+        lines = ["| " + " | ".join(df.columns) + " |", "|" + "---|" * df.width]
+        for row in df.iter_rows():
+            lines.append("| " + " | ".join("" if v is None else str(v) for v in row) + " |")
+        return "\n".join(lines) + "\n"
+    return df.write_csv()
+
+
+def _column_summary(df: pl.DataFrame) -> str:
+    """One line per column: dtype, nulls and either min/max/mean or distinct count"""
+    lines = []
+    for name, dtype in df.schema.items():
+        col = df.get_column(name)
+        stats = [f"nulls={col.null_count()}"]
+        if dtype.is_numeric():
+            stats += [f"min={col.min()}", f"max={col.max()}", f"mean={col.mean():.4g}" if col.mean() is not None else "mean=None"]
+        elif dtype.is_temporal():
+            stats += [f"min={col.min()}", f"max={col.max()}"]
+        else:
+            try:
+                stats.append(f"distinct={col.n_unique()}")
+            except Exception:
+                pass
+        lines.append(f"- {name} ({dtype}): " + ", ".join(stats))
+    return "\n".join(lines)
+
+
+def _clip(text: str, max_bytes: int) -> str:
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore") + "\n[output clipped]"
+
+
+def render_result(df: pl.DataFrame, handle: str | None, max_rows: int, max_cols: int, max_bytes: int, sample_rows: int, fmt: str = "csv") -> str:
+    """
+    Render a query result for the LLM within row/column/byte budgets.
+    Small results are returned whole; larger ones become a summary (shape, per-column
+    stats, head/tail sample) plus the handle to page through the full result.
+    """
+    shown = df.select(df.columns[:max_cols])
+    if df.height <= max_rows and df.width <= max_cols:
+        text = _to_text(shown, fmt)
+        if len(text.encode("utf-8")) <= max_bytes:
+            return f"{df.height} rows x {df.width} columns\n{text}"
+
+    header = [f"Result truncated: {df.height} rows x {df.width} columns."]
+    if handle is not None:
+        header.append(f"Full result saved as handle '{handle}'; call page_result(handle='{handle}', offset=..., limit=...) to read specific rows.")
+    if df.width > max_cols:
+        header.append(f"Showing {max_cols} of {df.width} columns; omitted: {', '.join(df.columns[max_cols:])}")
+    summary = "Column summary:\n" + _column_summary(shown)
+
+    half = max(sample_rows // 2, 1)
+    while True:
+        if df.height <= half * 2:
+            sample = "Rows:\n" + _to_text(shown, fmt)
+        else:
+            sample = f"First {half} rows:\n{_to_text(shown.head(half), fmt)}Last {half} rows:\n{_to_text(shown.tail(half), fmt)}"
+        text = "\n".join(header) + "\n" + summary + "\n" + sample
+        if len(text.encode("utf-8")) <= max_bytes or half == 1:
+            return _clip(text, max_bytes)
+        half //= 2
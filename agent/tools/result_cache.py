@@ -0,0 +1,178 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+import yaml
+from collections import OrderedDict
+import polars as pl
+
+from metrics import (
+    agent_sql_cache_hits_total,
+    agent_sql_cache_misses_total,
+    agent_sql_cache_evictions_total,
+    agent_sql_cache_bytes
+)
+
+config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs.yaml")
+with open(config_path, "r") as f:
+    configs = yaml.safe_load(f)
+
+RESULT_CACHE = configs.get('tools', {}).get('result_cache', {})
+
+_QUOTED_OR_SPACE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace outside quoted literals/identifiers and drop trailing semicolons"""
+    normalized = _QUOTED_OR_SPACE.sub(lambda m: m.group(1) or " ", query.strip())
+    return normalized.rstrip("; ").strip()
+
+
+class ResultCache:
+    """
+    Byte-bounded LRU of SQL results keyed by (dataset content hash, normalized SQL).
+    Results are stored as zstd-compressed Arrow IPC. With disk_dir set, entries are also
+    written to a directory that other workers on the same host read from.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, disk_dir: str = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[tuple, tuple[bytes, float]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, dataset_hash: str, query: str) -> pl.DataFrame | None:
+        key = (dataset_hash, normalize_sql(query))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl_seconds:
+                self._evict(key, "expired")
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                agent_sql_cache_hits_total.labels(tier="memory").inc()
+                return pl.read_ipc(io.BytesIO(entry[0]))
+
+        data = self._read_disk(key, now)
+        if data is None:
+            agent_sql_cache_misses_total.inc()
+            return None
+        agent_sql_cache_hits_total.labels(tier="disk").inc()
+        self._put_memory(key, data, now)
+        return pl.read_ipc(io.BytesIO(data))
+
+    def put(self, dataset_hash: str, query: str, result: pl.DataFrame) -> None:
+        key = (dataset_hash, normalize_sql(query))
+        buf = io.BytesIO()
+        result.write_ipc(buf, compression="zstd")
+        data = buf.getvalue()
+        now = time.time()
+        self._put_memory(key, data, now)
+        self._write_disk(key, data)
+
+    def invalidate(self, dataset_hash: str) -> None:
+        """Drop every cached result for a dataset"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == dataset_hash]:
+                self._evict(key, "invalidated")
+        if self.disk_dir:
+            dataset_dir = os.path.join(self.disk_dir, dataset_hash)
+            if os.path.isdir(dataset_dir):
+                for name in os.listdir(dataset_dir):
+                    self._remove(os.path.join(dataset_dir, name))
+
+    def _put_memory(self, key: tuple, data: bytes, created_at: float) -> None:
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key, "replaced")
+            while self._entries and self._total_bytes + size > self.max_bytes:
+                self._evict(next(iter(self._entries)), "lru")
+            self._entries[key] = (data, created_at)
+            self._total_bytes += size
+            agent_sql_cache_bytes.set(self._total_bytes)
+
+    def _evict(self, key: tuple, reason: str) -> None:
+        data, _ = self._entries.pop(key)
+        self._total_bytes -= len(data)
+        agent_sql_cache_evictions_total.labels(reason=reason).inc()
+        agent_sql_cache_bytes.set(self._total_bytes)
+
+    def _disk_path(self, key: tuple) -> str:
+        dataset_hash, query = key
+        return os.path.join(self.disk_dir, dataset_hash, hashlib.sha256(query.encode()).hexdigest() + ".arrow")
+
+    def _read_disk(self, key: tuple, now: float) -> bytes | None:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if now - os.path.getmtime(path) > self.ttl_seconds:
+                self._remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: tuple, data: bytes) -> None:
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._enforce_disk_budget()
+
+    def _enforce_disk_budget(self) -> None:
+        """Remove expired files, then the oldest ones, until the directory fits disk_max_bytes"""
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".arrow"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                else:
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Shared by every request in this worker; disk_dir shares entries between workers on a host
+result_cache = ResultCache(
+    max_bytes=RESULT_CACHE.get('max_mb', 256) * 1024 * 1024,
+    ttl_seconds=RESULT_CACHE.get('ttl_seconds', 3600),
+    disk_dir=RESULT_CACHE.get('disk_dir'),
+    disk_max_bytes=RESULT_CACHE.get('disk_max_mb', 1024) * 1024 * 1024
+) if RESULT_CACHE.get('enabled', True) else None
@@ -1,56 +1,352 @@
 from math import exp
 import polars as pl
-pl.Config.set_tbl_cols(1000)
+import yaml
+import os
+import sys
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from functools import partial
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from tools.out_of_core import OutOfCoreError, QueryWorkerPool
+from tools.indexes import build_column_index, build_distinct_index, page_distinct_values
+from tools.value_index import build_value_index, find_values
+from tools.result_cache import result_cache
+from tools.ipc_cache import ipc_cache
+from tools.render import render_result
+
+config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "configs.yaml")
+with open(config_path, "r") as f:
+    configs = yaml.safe_load(f)
+
+STREAMING = configs.get('tools', {}).get('streaming', True)
+OUT_OF_CORE = configs.get('tools', {}).get('out_of_core', {})
+OUT_OF_CORE_MEMORY_LIMIT_BYTES = OUT_OF_CORE.get('memory_limit_mb', 2048) * 1024 * 1024
+OUT_OF_CORE_MAX_RESULT_ROWS = OUT_OF_CORE.get('max_result_rows', 100000)
+OUT_OF_CORE_TIMEOUT = OUT_OF_CORE.get('timeout_seconds', 300)
+EXECUTOR = configs.get('tools', {}).get('executor', {})
+ISOLATE_LAZY_QUERIES = EXECUTOR.get('lazy_queries', 'thread') == "process"
+ISOLATED_MEMORY_LIMIT_BYTES = EXECUTOR.get('memory_limit_mb', 1024) * 1024 * 1024
+ISOLATED_MAX_RESULT_ROWS = EXECUTOR.get('max_result_rows')
+QUERY_WORKERS = configs.get('tools', {}).get('query_workers', {})
+DISTINCT_INDEX = configs.get('indexes', {}).get('distinct', {})
+DISTINCT_MAX_CARDINALITY = DISTINCT_INDEX.get('max_cardinality', 1000)
+DISTINCT_PAGE_SIZE = DISTINCT_INDEX.get('page_size', 100)
+VALUE_INDEX = configs.get('indexes', {}).get('values', {})
+VALUE_INDEX_MAX_VALUES = VALUE_INDEX.get('max_values_per_column', 100000)
+VALUE_INDEX_MAX_RESULTS = VALUE_INDEX.get('max_results', 20)
+RENDER = configs.get('tools', {}).get('render', {})
+RENDER_MAX_ROWS = RENDER.get('max_rows', 50)
+RENDER_MAX_COLS = RENDER.get('max_cols', 30)
+RENDER_MAX_BYTES = RENDER.get('max_bytes', 8000)
+RENDER_SAMPLE_ROWS = RENDER.get('sample_rows', 10)
+RENDER_FORMAT = RENDER.get('format', 'csv')
+RENDER_MAX_HANDLES = RENDER.get('max_handles', 20)
+# Column limit for the str() tables in the dataset profile
+PROFILE_TBL_COLS = 1000
+
+# Shared by every Tools instance in this worker
+query_workers = QueryWorkerPool(
+    idle_workers=QUERY_WORKERS.get('idle', 4),
+    max_queries=QUERY_WORKERS.get('max_queries', 100),
+    recycle_rss_bytes=QUERY_WORKERS.get('recycle_mb', 512) * 1024 * 1024
+)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 
 class Tools():
-    def __init__(self, df: pl.DataFrame):
+    def __init__(self, df: pl.DataFrame | pl.LazyFrame, out_of_core: bool = False, distinct_index: dict = None, value_index: pl.DataFrame | pl.LazyFrame = None, dataset_hash: str = None):
+        """
+        Wrap either an eager DataFrame or a LazyFrame (e.g. a scan of the stored Parquet file).
+        In lazy mode queries get projection/predicate pushdown and only read the columns they touch.
+        With out_of_core=True (datasets larger than worker RAM) every collect runs on the streaming
+        engine in a child process under a memory ceiling, see tools/out_of_core.py.
+        distinct_index and value_index are the upload-time indexes built by
+        build_distinct_index() and build_value_index(), if any.
+        dataset_hash (the content hash of the stored dataset) enables the shared SQL result cache.
+        """
+        if out_of_core and not isinstance(df, pl.LazyFrame):
+            df = df.lazy()
         self.df = df
-    
+        self.lazy = isinstance(df, pl.LazyFrame)
+        self.out_of_core = out_of_core
+        self.distinct_index = distinct_index
+        self.value_index = value_index
+        self.dataset_hash = dataset_hash
+        # Without an upload-time value index, columns are indexed on first lookup
+        self._lazily_indexed_columns = None if value_index is not None else set()
+        # Full results of rendered queries, by handle, for page_result()
+        self._results: "OrderedDict[str, pl.DataFrame]" = OrderedDict()
+        self._result_counter = 0
+        self._ipc_path = None
+        self._ipc_lock = threading.Lock()
+        # SQL that ran successfully in this request, stored with the answer for conversation memory
+        self.queries = []
+        # Lookups run on the SQL thread pool; serializes building missing index entries
+        self._index_lock = threading.Lock()
+
+    def _collect(self, lf: pl.LazyFrame, op: str = "collect", isolated: bool = False, cancel: threading.Event = None) -> pl.DataFrame:
+        if self.out_of_core:
+            return query_workers.collect(
+                lf,
+                memory_limit_bytes=OUT_OF_CORE_MEMORY_LIMIT_BYTES,
+                max_rows=OUT_OF_CORE_MAX_RESULT_ROWS,
+                timeout=OUT_OF_CORE_TIMEOUT,
+                op=op,
+                cancel=cancel
+            )
+        if isolated:
+            return query_workers.collect(
+                lf,
+                memory_limit_bytes=ISOLATED_MEMORY_LIMIT_BYTES,
+                max_rows=ISOLATED_MAX_RESULT_ROWS,
+                op=op,
+                cancel=cancel
+            )
+        if op == "describe":
+            return lf.describe()
+        return lf.collect(engine="streaming" if STREAMING else "auto")
+
     def explore(self) -> pl.DataFrame:
         """
         Explore the dataframe and return a summary of the data.
         Equivalent to pandas `describe(include='all')`.
         """
+        if self.lazy:
+            return self._collect(self.df, op="describe")
         return self.df.describe()
 
     def columns(self) -> list[str]:
         """
         Return the columns of the dataframe.
         """
+        if self.lazy:
+            return self.df.collect_schema().names()
         return self.df.columns
 
     def shape(self) -> tuple[int, int]:
         """
         Return the shape of the dataframe as (rows, columns).
         """
+        if self.lazy:
+            rows = self._collect(self.df.select(pl.len())).item()
+            return (rows, self.df.collect_schema().len())
         return self.df.shape
 
     def head(self, n: int = 5) -> pl.DataFrame:
         """
         Return the first n rows of the dataframe.
         """
+        if self.lazy:
+            return self._collect(self.df.head(n))
         return self.df.head(n)
 
     def tail(self, n: int = 5) -> pl.DataFrame:
         """
         Return the last n rows of the dataframe.
         """
+        if self.lazy:
+            return self._collect(self.df.tail(n))
         return self.df.tail(n)
 
     def info(self) -> str:
         """Return schema and basic information of the dataframe"""
-        info_lines = [f"Shape: {self.df.shape}", "Schema:"]
-        for name, dtype in self.df.schema.items():
+        schema = self.df.collect_schema() if self.lazy else self.df.schema
+        info_lines = [f"Shape: {self.shape()}", "Schema:"]
+        for name, dtype in schema.items():
             info_lines.append(f"  {name}: {dtype}")
         return "\n".join(info_lines)
 
-    def sql(self, query: str):
+    @staticmethod
+    def invalidate_cached_results(dataset_hash: str) -> None:
+        """Drop cached SQL results for a dataset, e.g. when it is deleted"""
+        if result_cache is not None:
+            result_cache.invalidate(dataset_hash)
+
+    def materialize(self) -> pl.DataFrame:
+        """Return the data as an eager DataFrame, collecting the LazyFrame if needed"""
+        if self.out_of_core:
+            raise OutOfCoreError("Dataset is too large to load into memory. Aggregate it with sql() first.")
+        if self.lazy:
+            return self._collect(self.df)
+        return self.df
+
+    def ipc_path(self) -> str:
+        """
+        Path of an uncompressed Arrow IPC copy of the data for plot workers to memory-map.
+        With a dataset_hash the copy comes from the host's ipc_cache (written only if no
+        request wrote it before) and is referenced for as long as this Tools instance lives;
+        otherwise it is written on first use and removed together with this instance.
+        """
+        with self._ipc_lock:
+            if self._ipc_path is None and self.dataset_hash is not None:
+                path, fd = ipc_cache.acquire(self.dataset_hash, lambda p: self.materialize().write_ipc(p, compression="uncompressed"))
+                weakref.finalize(self, ipc_cache.release, fd)
+                self._ipc_path = path
+            if self._ipc_path is None:
+                df = self.materialize()
+                fd, path = tempfile.mkstemp(prefix="blinq-plot-", suffix=".arrow")
+                os.close(fd)
+                df.write_ipc(path, compression="uncompressed")
+                weakref.finalize(self, _remove_file, path)
+                self._ipc_path = path
+            return self._ipc_path
+
+    def profile(self) -> dict:
+        """
+        Compute the dataset profile used as agent context, in a JSON-serializable form.
+        Computed once at upload time and persisted next to the dataset.
+        """
+        with pl.Config(tbl_cols=PROFILE_TBL_COLS):
+            try:
+                exploration = str(self.explore())
+            except OutOfCoreError as e:
+                exploration = f"Unavailable for this dataset: {str(e)}"
+            return {
+                "exploration": exploration,
+                "columns": list(self.columns()),
+                "shape": list(self.shape()),
+                "head": str(self.head()),
+                "tail": str(self.tail()),
+                "info": self.info()
+            }
+
+    def build_distinct_index(self) -> dict:
+        """
+        Build the distinct-value index (values, frequencies, cardinality) for every
+        low-cardinality column. Computed once at upload time and persisted.
+        """
+        return build_distinct_index(self.df.lazy(), self._collect, DISTINCT_MAX_CARDINALITY)
+
+    def distinct_values(self, column: str, offset: int = 0, limit: int = None, cancel: threading.Event = None) -> dict:
+        """
+        Return distinct values of a column with their frequencies, most frequent first,
+        answered from the distinct-value index instead of scanning the data.
+        Columns missing from the index are scanned once; blocking, so call it off the event loop.
+        """
+        if column not in self.columns():
+            return {"error": f"Unknown column '{column}'. Available columns: {self.columns()}", "status": "failed"}
+        with self._index_lock:
+            if self.distinct_index is None:
+                self.distinct_index = {}
+            entry = self.distinct_index.get(column)
+            if entry is None:
+                try:
+                    entry = build_column_index(self.df.lazy(), partial(self._collect, cancel=cancel), column, DISTINCT_MAX_CARDINALITY)
+                except OutOfCoreError as e:
+                    return {"error": str(e), "status": "failed"}
+                self.distinct_index[column] = entry
+        limit = min(limit or DISTINCT_PAGE_SIZE, DISTINCT_PAGE_SIZE)
+        return page_distinct_values(entry, column, max(offset, 0), limit)
+
+    def build_value_index(self) -> pl.DataFrame:
+        """
+        Build the trigram index over distinct values of every string column.
+        Computed once at upload time and stored as a Parquet blob next to the dataset.
+        """
+        return build_value_index(self.df.lazy(), self._collect, VALUE_INDEX_MAX_VALUES)
+
+    def find_values(self, column: str, terms: list[str], limit: int = None, cancel: threading.Event = None) -> dict:
+        """
+        Return values of a text column that fuzzily match any of the terms, best matches first,
+        looked up in the trigram index instead of scanning with LIKE.
+        Blocking (the lookup joins the index, which may first be built), so call it off the event loop.
+        """
+        schema = self.df.collect_schema() if self.lazy else self.df.schema
+        if column not in schema:
+            return {"error": f"Unknown column '{column}'. Available columns: {schema.names()}", "status": "failed"}
+        if schema[column] not in (pl.String, pl.Categorical):
+            return {"error": f"Column '{column}' is {schema[column]}, find_values only searches text columns", "status": "failed"}
+        with self._index_lock:
+            if self._lazily_indexed_columns is not None and column not in self._lazily_indexed_columns:
+                try:
+                    column_index = build_value_index(self.df.lazy().select(column), partial(self._collect, cancel=cancel), VALUE_INDEX_MAX_VALUES)
+                except OutOfCoreError as e:
+                    return {"error": str(e), "status": "failed"}
+                if self.value_index is None:
+                    self.value_index = column_index
+                else:
+                    self.value_index = pl.concat([self.value_index, column_index], how="vertical_relaxed")
+                self._lazily_indexed_columns.add(column)
+        limit = min(limit or VALUE_INDEX_MAX_RESULTS, VALUE_INDEX_MAX_RESULTS)
+        return {"column": column, "candidates": find_values(self.value_index, column, terms, limit)}
+
+    def render(self, result: pl.DataFrame) -> str:
+        """
+        Render a query result for the LLM within the configured row/column/byte budgets.
+        Results that don't fit are kept under a handle that page_result() reads from.
+        """
+        fits = result.height <= RENDER_MAX_ROWS and result.width <= RENDER_MAX_COLS
+        handle = None if fits else self._store_result(result)
+        text = render_result(result, handle, RENDER_MAX_ROWS, RENDER_MAX_COLS, RENDER_MAX_BYTES, RENDER_SAMPLE_ROWS, RENDER_FORMAT)
+        if handle is None and text.startswith("Result truncated"):
+            # Fit by shape but not by bytes; keep it so the rows remain reachable
+            handle = self._store_result(result)
+            text = render_result(result, handle, RENDER_MAX_ROWS, RENDER_MAX_COLS, RENDER_MAX_BYTES, RENDER_SAMPLE_ROWS, RENDER_FORMAT)
+        return text
+
+    def _store_result(self, result: pl.DataFrame) -> str:
+        self._result_counter += 1
+        handle = f"r{self._result_counter}"
+        self._results[handle] = result
+        while len(self._results) > RENDER_MAX_HANDLES:
+            self._results.popitem(last=False)
+        return handle
+
+    def page_result(self, handle: str, offset: int = 0, limit: int = None, columns: list[str] = None) -> str | dict:
+        """
+        Return rows [offset, offset + limit) of a previously truncated result,
+        optionally restricted to some of its columns.
+        """
+        result = self._results.get(handle)
+        if result is None:
+            return {"error": f"Unknown or expired result handle '{handle}'. Available handles: {list(self._results)}", "status": "failed"}
+        if columns:
+            missing = [c for c in columns if c not in result.columns]
+            if missing:
+                return {"error": f"Unknown columns {missing}. Result columns: {result.columns}", "status": "failed"}
+            result = result.select(columns)
+        offset = max(offset or 0, 0)
+        limit = min(limit or RENDER_MAX_ROWS, RENDER_MAX_ROWS)
+        page = result.slice(offset, limit)
+        next_offset = offset + page.height
+        header = f"Rows {offset}-{next_offset - 1} of {result.height} from '{handle}'"
+        if next_offset < result.height:
+            header += f" (next_offset={next_offset})"
+        return header + "\n" + render_result(page, None, RENDER_MAX_ROWS, RENDER_MAX_COLS, RENDER_MAX_BYTES, RENDER_SAMPLE_ROWS, RENDER_FORMAT)
+
+    def sql(self, query: str, cancel: threading.Event = None):
         """
         execute a sql query using polars
+        LazyFrame queries run in a killable child process when tools.executor.lazy_queries
+        is "process"; cancel stops such a query early (see tools/executor.py).
         """
+        use_cache = result_cache is not None and self.dataset_hash is not None
+        if use_cache:
+            cached = result_cache.get(self.dataset_hash, query)
+            if cached is not None:
+                return cached
         try:
-            return self.df.sql(query)
+            if self.lazy:
+                ctx = pl.SQLContext(frames={"self": self.df})
+                result = self._collect(ctx.execute(query, eager=False), isolated=ISOLATE_LAZY_QUERIES, cancel=cancel)
+            else:
+                result = self.df.sql(query)
+            if use_cache:
+                result_cache.put(self.dataset_hash, query, result)
+            return result
+        except OutOfCoreError as e:
+            error_msg = str(e)
+            print(error_msg)
+            return {"error": error_msg, "status": "failed"}
         except Exception as e:
             error_msg = f"SQL Error: {str(e)}"
             print(error_msg)
@@ -59,4 +355,5 @@ class Tools():
 
 if __name__ == "__main__":
     df = pl.read_csv("../data/data.csv")
-    print(Tools(df).explore())
\ No newline at end of file
+    with pl.Config(tbl_cols=PROFILE_TBL_COLS):
+        print(Tools(df).explore())
\ No newline at end of file
@@ -0,0 +1,100 @@
+import polars as pl
+from typing import Callable
+
+# Minimum fraction of a search term's trigrams a value must contain to be a candidate
+MIN_SCORE = 0.3
+
+
+def _normalize(expr: pl.Expr) -> pl.Expr:
+    return expr.str.to_lowercase().str.replace_all(r"\s+", " ").str.strip_chars()
+
+
+def _trigrams(frame: pl.DataFrame, text_column: str) -> pl.DataFrame:
+    """Explode each row into the distinct padded trigrams of its normalized text"""
+    padded = pl.lit("  ") + _normalize(pl.col(text_column)) + pl.lit(" ")
+    return (
+        frame
+        .with_columns(_padded=padded)
+        .with_columns(_pos=pl.int_ranges(0, pl.col("_padded").str.len_chars() - 2))
+        .explode("_pos")
+        .with_columns(trigram=pl.col("_padded").str.slice(pl.col("_pos"), 3))
+        .drop("_padded", "_pos")
+        .unique()
+    )
+
+
+def build_value_index(lf: pl.LazyFrame, collect: Callable, max_values: int) -> pl.DataFrame:
+    """
+    Trigram inverted index over the distinct values of every string column.
+    One row per (column, value, trigram); values beyond the max_values most frequent
+    per column are left out. Persisted as Parquet next to the dataset.
+    """
+    schema = lf.collect_schema()
+    parts = []
+    for column, dtype in schema.items():
+        if dtype not in (pl.String, pl.Categorical):
+            continue
+        values = collect(
+            lf.select(pl.col(column).cast(pl.String).alias("value"))
+            .drop_nulls()
+            .group_by("value")
+            .len("count")
+            .sort("count", descending=True)
+            .head(max_values)
+        )
+        if values.height == 0:
+            continue
+        postings = _trigrams(values.with_columns(column=pl.lit(column)), "value")
+        n_trigrams = postings.group_by("value").len("n_trigrams")
+        parts.append(postings.join(n_trigrams, on="value"))
+
+    if not parts:
+        return pl.DataFrame(schema={"value": pl.String, "count": pl.UInt32, "column": pl.String, "trigram": pl.String, "n_trigrams": pl.UInt32})
+    return pl.concat(parts).select(
+        pl.col("column").cast(pl.Categorical),
+        "trigram",
+        "value",
+        pl.col("count").cast(pl.UInt32),
+        pl.col("n_trigrams").cast(pl.UInt32)
+    ).sort("column", "trigram")
+
+
+def find_values(index: pl.DataFrame | pl.LazyFrame, column: str, terms: list[str], limit: int) -> list[dict]:
+    """
+    Rank a column's values by trigram similarity to any of the search terms.
+    score is the fraction of the term's trigrams found in the value; ties go to the
+    closer overall match (Jaccard) and then to more frequent values.
+    """
+    terms = [t for t in terms if t and t.strip()]
+    if not terms:
+        return []
+    term_trigrams = _trigrams(pl.DataFrame({"term": terms}), "term")
+    term_sizes = term_trigrams.group_by("term").len("term_trigrams")
+
+    postings = index.lazy().filter(pl.col("column").cast(pl.String) == column).select("trigram", "value", "count", "n_trigrams")
+    matches = (
+        term_trigrams.lazy()
+        .join(postings, on="trigram")
+        .group_by("term", "value", "count", "n_trigrams")
+        .len("matches")
+        .join(term_sizes.lazy(), on="term")
+        .with_columns(
+            score=pl.col("matches") / pl.col("term_trigrams"),
+            similarity=pl.col("matches") / (pl.col("term_trigrams") + pl.col("n_trigrams") - pl.col("matches"))
+        )
+        .filter(pl.col("score") >= MIN_SCORE)
+        .sort("score", "similarity", "count", descending=True)
+        .group_by("value", maintain_order=True)
+        .first()
+        .head(limit)
+        .collect()
+    )
+    return [
+        {
+            "value": row["value"],
+            "count": row["count"],
+            "score": round(row["score"], 3),
+            "matched_term": row["term"]
+        }
+        for row in matches.iter_rows(named=True)
+    ]
@@ -1,6 +1,6 @@
 from app.auth.password import hash_password, verify_password
 from app.auth.jwt_handler import create_access_token, create_refresh_token, verify_token
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user, get_current_user_ws
 
 __all__ = [
     "hash_password",
@@ -8,5 +8,6 @@ __all__ = [
     "create_access_token",
     "create_refresh_token",
     "verify_token",
-    "get_current_user"
+    "get_current_user",
+    "get_current_user_ws"
 ]
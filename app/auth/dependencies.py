@@ -1,4 +1,4 @@
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, WebSocket, WebSocketException
 from app.auth.jwt_handler import verify_token
 
 def get_current_user(request: Request) -> str:
@@ -15,3 +15,11 @@ def get_current_user(request: Request) -> str:
             detail="Invalid authentication credentials",
         )
     return user_id
+
+def get_current_user_ws(websocket: WebSocket) -> str:
+    """get_current_user for WebSocket routes; browsers send the auth cookie on the handshake"""
+    token = websocket.cookies.get("access_token")
+    user_id = verify_token(token) if token else None
+    if user_id is None:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+    return user_id
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import List
 import os
 
 class SubscriptionLimits(BaseModel):
@@ -19,6 +20,47 @@ class RazorpayConfig(BaseModel):
     KEY_SECRET: str = os.getenv("RAZORPAY_KEY_SECRET", "")
     WEBHOOK_SECRET: str = os.getenv("RAZORPAY_WEBHOOK_SECRET", "")
 
+class BlobStoreConfig(BaseModel):
+    """Blob storage for uploaded datasets and plot images"""
+    BACKEND: str = os.getenv("BLOB_STORE_BACKEND", "local")
+    LOCAL_PATH: str = os.getenv("BLOB_STORE_PATH", "blobs")
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "")
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "")
+    S3_PREFIX: str = os.getenv("S3_PREFIX", "")
+    # Local copies of remote blobs that are scanned rather than read (large datasets, indexes)
+    CACHE_PATH: str = os.getenv("BLOB_CACHE_PATH", "cache/blobs")
+    CACHE_MAX_BYTES: int = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(20 * 1024 * 1024 * 1024)))
+
+class UploadConfig(BaseModel):
+    """Dataset upload limits"""
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(5 * 1024 * 1024 * 1024)))
+    SPOOL_DIR: str = os.getenv("UPLOAD_SPOOL_DIR", "")
+
+class DatasetConfig(BaseModel):
+    """How the analysis endpoint hands datasets to the agent"""
+    ENGINE: str = os.getenv("DATASET_ENGINE", "eager")  # 'eager' (cached DataFrame) or 'lazy' (Parquet scan)
+    OUT_OF_CORE_THRESHOLD_BYTES: int = int(os.getenv("OUT_OF_CORE_THRESHOLD_BYTES", str(1024 * 1024 * 1024)))
+
+class DataFrameCacheConfig(BaseModel):
+    """Per-worker parsed DataFrame cache"""
+    MAX_BYTES: int = int(os.getenv("DF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+class PlotEventsConfig(BaseModel):
+    """How plot-ready notifications reach the request waiting for them"""
+    BACKEND: str = os.getenv("PLOT_EVENTS_BACKEND", "local")  # 'local' (in-process) or 'postgres' (LISTEN/NOTIFY)
+    CHANNEL: str = os.getenv("PLOT_EVENTS_CHANNEL", "plot_ready")
+
+class PlotVariantConfig(BaseModel):
+    """Downscaled WebP variants of plot images served via ?width="""
+    WIDTHS: List[int] = [int(w) for w in os.getenv("PLOT_VARIANT_WIDTHS", "320,640,1280").split(",") if w.strip()]
+    WEBP_QUALITY: int = int(os.getenv("PLOT_VARIANT_WEBP_QUALITY", "80"))
+
 subscription_limits = SubscriptionLimits()
 pricing = Pricing()
 razorpay_config = RazorpayConfig()
+blob_store_config = BlobStoreConfig()
+upload_config = UploadConfig()
+dataset_config = DatasetConfig()
+dataframe_cache_config = DataFrameCacheConfig()
+plot_events_config = PlotEventsConfig()
+plot_variant_config = PlotVariantConfig()
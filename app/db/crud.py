@@ -1,9 +1,13 @@
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.db.models import User, Conversation, CSVFile, Message, Plot, UsageTracking, RefreshToken
 from app.db.schemas import (
     UserCreate, ConversationCreate, CSVFileCreate,
     MessageCreate, PlotCreate, UsageTrackingCreate, RefreshTokenCreate
 )
+from app.storage import blob_store
+from app.utils.db_events import db_events
 from uuid import UUID
 from datetime import datetime, timedelta
 
@@ -92,14 +96,25 @@ def extend_csv_expiration(db: Session, conversation_id: UUID):
     return conversation
 
 def create_csv_file(db: Session, user_id: UUID, csv_data: CSVFileCreate):
+    csv_blob = blob_store.put_file(csv_data.csv_path, sha256=csv_data.csv_sha256)
+    parquet_blob = blob_store.put_file(csv_data.parquet_path) if csv_data.parquet_path else None
+    value_index_blob = blob_store.put_file(csv_data.value_index_path) if csv_data.value_index_path else None
     csv_file = CSVFile(
         user_id=user_id,
         conversation_id=csv_data.conversation_id,
         filename=csv_data.filename,
-        file_size=csv_data.file_size,
+        file_size=csv_blob.size,
         row_count=csv_data.row_count,
         column_names=csv_data.column_names,
-        csv_data=csv_data.csv_data,
+        csv_blob_key=csv_blob.key,
+        csv_sha256=csv_blob.sha256,
+        parquet_blob_key=parquet_blob.key if parquet_blob else None,
+        parquet_size=parquet_blob.size if parquet_blob else None,
+        parquet_sha256=parquet_blob.sha256 if parquet_blob else None,
+        column_schema=csv_data.column_schema,
+        profile=csv_data.profile,
+        distinct_index=csv_data.distinct_index,
+        value_index_blob_key=value_index_blob.key if value_index_blob else None,
         expires_at=csv_data.expires_at
     )
     db.add(csv_file)
@@ -122,6 +137,7 @@ def mark_csv_as_deleted(db: Session, csv_id: UUID):
         csv_file.is_deleted = True
         db.commit()
         db.refresh(csv_file)
+    db_events.dataset_deleted(csv_id, csv_file.csv_sha256 if csv_file else None)
     return csv_file
 
 def create_message(db: Session, message_data: MessageCreate):
@@ -131,7 +147,8 @@ def create_message(db: Session, message_data: MessageCreate):
         content=message_data.content,
         cost=message_data.cost,
         request_id=message_data.request_id,
-        is_plotting=message_data.is_plotting
+        is_plotting=message_data.is_plotting,
+        queries=message_data.queries
     )
     db.add(message)
     db.commit()
@@ -144,30 +161,102 @@ def create_message(db: Session, message_data: MessageCreate):
 
     return message
 
-def get_conversation_messages(db: Session, conversation_id: UUID, skip: int = 0, limit: int = 100):
-    return db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.asc()).offset(skip).limit(limit).all()
+def get_conversation_messages(db: Session, conversation_id: UUID, skip: int = 0, limit: int = 100, after: datetime = None):
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if after is not None:
+        query = query.filter(Message.created_at > after)
+    return query.order_by(Message.created_at.asc()).offset(skip).limit(limit).all()
+
+def get_recent_conversation_messages(db: Session, conversation_id: UUID, limit: int, after: datetime = None):
+    """The newest limit messages (after after, if given), oldest first"""
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if after is not None:
+        query = query.filter(Message.created_at > after)
+    return list(reversed(query.order_by(Message.created_at.desc()).limit(limit).all()))
+
+def update_conversation_summary(db: Session, conversation_id: UUID, summary: str, summarized_until: datetime, previous_until: datetime = None):
+    """
+    Store a new running summary unless another request already advanced it past previous_until.
+    Returns whether it was stored.
+    """
+    query = db.query(Conversation).filter(Conversation.id == conversation_id)
+    if previous_until is None:
+        query = query.filter(Conversation.summarized_until.is_(None))
+    else:
+        query = query.filter(Conversation.summarized_until == previous_until)
+    updated = query.update({Conversation.summary: summary, Conversation.summarized_until: summarized_until}, synchronize_session=False)
+    db.commit()
+    return updated == 1
 
 def get_message_by_id(db: Session, message_id: UUID):
     return db.query(Message).filter(Message.id == message_id).first()
 
+# Concurrent plots of one request race for the next position; retry on the unique constraint
+PLOT_POSITION_ATTEMPTS = 5
+
 def create_plot(db: Session, plot_data: PlotCreate):
-    plot = Plot(
-        message_id=plot_data.message_id,
-        request_id=plot_data.request_id,
-        image_data=plot_data.image_data
-    )
-    db.add(plot)
+    image_blob = blob_store.put_bytes(plot_data.image_data) if plot_data.image_data is not None else None
+    for attempt in range(PLOT_POSITION_ATTEMPTS):
+        position = db.query(func.coalesce(func.max(Plot.position) + 1, 0)).filter(
+            Plot.request_id == plot_data.request_id
+        ).scalar()
+        plot = Plot(
+            message_id=plot_data.message_id,
+            request_id=plot_data.request_id,
+            position=position,
+            kind="chart" if plot_data.spec is not None else "image",
+            spec=plot_data.spec
+        )
+        if image_blob is not None:
+            _set_plot_image(plot, image_blob)
+        db.add(plot)
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+            if attempt == PLOT_POSITION_ATTEMPTS - 1:
+                raise
+    db.refresh(plot)
+    db_events.plot_saved(str(plot.request_id))
+    return plot
+
+def _set_plot_image(plot: Plot, image_blob):
+    plot.image_blob_key = image_blob.key
+    plot.image_size = image_blob.size
+    plot.image_sha256 = image_blob.sha256
+
+def set_plot_image(db: Session, plot: Plot, image_data: bytes):
+    """Attach a rendered PNG to a plot, e.g. the export of a chart spec"""
+    _set_plot_image(plot, blob_store.put_bytes(image_data))
     db.commit()
     db.refresh(plot)
     return plot
 
-def get_plot_by_request_id(db: Session, request_id: UUID):
-    return db.query(Plot).filter(Plot.request_id == request_id).first()
+def set_plot_variant(db: Session, plot: Plot, width: int, image_data: bytes):
+    """Store a downscaled variant of a plot's image"""
+    blob = blob_store.put_bytes(image_data)
+    variants = dict(plot.variants or {})
+    variants[str(width)] = {"key": blob.key, "size": blob.size, "sha256": blob.sha256}
+    plot.variants = variants
+    db.commit()
+    db.refresh(plot)
+    return plot
+
+def get_plot_by_request_id(db: Session, request_id: UUID, position: int = 0):
+    return db.query(Plot).filter(Plot.request_id == request_id, Plot.position == position).first()
 
-def get_plot_by_message_id(db: Session, message_id: UUID):
-    return db.query(Plot).filter(Plot.message_id == message_id).first()
+def get_plots_by_request_id(db: Session, request_id: UUID):
+    return db.query(Plot).filter(Plot.request_id == request_id).order_by(Plot.position).all()
+
+def get_plots_by_message_id(db: Session, message_id: UUID):
+    return db.query(Plot).filter(Plot.message_id == message_id).order_by(Plot.position).all()
+
+def attach_plots_to_message(db: Session, request_id: UUID, message_id: UUID):
+    """Link every plot of a request to the assistant message that answered it"""
+    db.query(Plot).filter(Plot.request_id == request_id).update({Plot.message_id: message_id})
+    db.commit()
+    return get_plots_by_request_id(db, request_id)
 
 def create_usage_tracking(db: Session, usage_data: UsageTrackingCreate):
     usage = UsageTracking(
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Enum, ForeignKey, Boolean, JSON, Float, LargeBinary, Text
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Enum, ForeignKey, Boolean, JSON, Float, Text, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -36,6 +36,10 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     csv_expires_at = Column(DateTime, nullable=True)
+    # Running summary of the turns older than the agent's memory window, and the time of the
+    # last message it covers
+    summary = Column(Text, nullable=True)
+    summarized_until = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="conversations")
     csv_file = relationship("CSVFile", foreign_keys=[csv_id], post_update=True)
@@ -48,10 +52,19 @@ class CSVFile(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
     conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False)
     filename = Column(String, nullable=False)
-    file_size = Column(Integer, nullable=False)
+    # Bytes; uploads can exceed the 2 GiB a 32-bit Integer holds
+    file_size = Column(BigInteger, nullable=False)
     row_count = Column(Integer, nullable=False)
     column_names = Column(JSON, nullable=False)
-    csv_data = Column(LargeBinary, nullable=False)
+    csv_blob_key = Column(String, nullable=False)
+    csv_sha256 = Column(String(64), nullable=False, index=True)
+    parquet_blob_key = Column(String, nullable=True)
+    parquet_size = Column(BigInteger, nullable=True)
+    parquet_sha256 = Column(String(64), nullable=True)
+    column_schema = Column(JSON, nullable=True)
+    profile = Column(JSON, nullable=True)
+    distinct_index = Column(JSON, nullable=True)
+    value_index_blob_key = Column(String, nullable=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=False, index=True)
     is_deleted = Column(Boolean, default=False)
@@ -69,22 +82,34 @@ class Message(Base):
     cost = Column(Float, nullable=True)
     request_id = Column(UUID(as_uuid=True), nullable=True, index=True)
     is_plotting = Column(Boolean, nullable=True)
+    # SQL behind an assistant answer, so follow-up questions can reuse what it discovered
+    queries = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     conversation = relationship("Conversation", back_populates="messages")
-    plot = relationship("Plot", back_populates="message", uselist=False, cascade="all, delete-orphan")
+    plots = relationship("Plot", back_populates="message", order_by="Plot.position", cascade="all, delete-orphan")
     usage_tracking = relationship("UsageTracking", back_populates="message", uselist=False, cascade="all, delete-orphan")
 
 class Plot(Base):
     __tablename__ = "plots"
+    __table_args__ = (UniqueConstraint("request_id", "position", name="uq_plots_request_position"),)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id"), nullable=True, unique=True)
-    request_id = Column(UUID(as_uuid=True), nullable=False, unique=True, index=True)
-    image_data = Column(LargeBinary, nullable=False)
+    message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id"), nullable=True, index=True)
+    request_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    # Order of the plot within its request/message, starting at 0
+    position = Column(Integer, nullable=False, default=0)
+    kind = Column(String, nullable=False, default="image")  # 'image' (matplotlib PNG) or 'chart' (Vega-Lite spec)
+    spec = Column(JSON, nullable=True)
+    # For charts the PNG is rendered from spec on first export
+    image_blob_key = Column(String, nullable=True)
+    image_size = Column(Integer, nullable=True)
+    image_sha256 = Column(String(64), nullable=True)
+    # Downscaled WebP copies by width: {"320": {"key", "size", "sha256"}}
+    variants = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    message = relationship("Message", back_populates="plot")
+    message = relationship("Message", back_populates="plots")
 
 class UsageTracking(Base):
     __tablename__ = "usage_tracking"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from uuid import UUID
 
@@ -46,10 +46,15 @@ class ConversationUpdate(BaseModel):
 class CSVFileCreate(BaseModel):
     conversation_id: UUID
     filename: str
-    file_size: int
     row_count: int
     column_names: List[str]
-    csv_data: bytes
+    csv_path: str
+    csv_sha256: Optional[str] = None
+    parquet_path: Optional[str] = None
+    column_schema: Optional[Dict[str, str]] = None
+    profile: Optional[dict] = None
+    distinct_index: Optional[dict] = None
+    value_index_path: Optional[str] = None
     expires_at: datetime
 
 class CSVFileResponse(BaseModel):
@@ -60,6 +65,7 @@ class CSVFileResponse(BaseModel):
     file_size: int
     row_count: int
     column_names: List[str]
+    column_schema: Optional[Dict[str, str]] = None
     uploaded_at: datetime
     expires_at: datetime
     is_deleted: bool
@@ -74,6 +80,7 @@ class MessageCreate(BaseModel):
     cost: Optional[float] = None
     request_id: Optional[UUID] = None
     is_plotting: Optional[bool] = None
+    queries: Optional[List[str]] = None
 
 class MessageResponse(BaseModel):
     id: UUID
@@ -83,6 +90,7 @@ class MessageResponse(BaseModel):
     cost: Optional[float]
     request_id: Optional[UUID]
     is_plotting: Optional[bool]
+    queries: Optional[List[str]] = None
     created_at: datetime
 
     class Config:
@@ -91,12 +99,19 @@ class MessageResponse(BaseModel):
 class PlotCreate(BaseModel):
     message_id: Optional[UUID] = None
     request_id: UUID
-    image_data: bytes
+    image_data: Optional[bytes] = None
+    spec: Optional[Dict] = None
 
 class PlotResponse(BaseModel):
     id: UUID
-    message_id: UUID
+    message_id: Optional[UUID]
     request_id: UUID
+    position: int
+    kind: str
+    image_size: Optional[int]
+    image_url: str
+    thumbnail_url: str
+    spec_url: Optional[str]
     created_at: datetime
 
     class Config:
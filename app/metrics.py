@@ -70,3 +70,24 @@ database_errors_total = Counter(
     'Total database errors',
     ['operation']
 )
+
+dataframe_cache_hits_total = Counter(
+    'dataframe_cache_hits_total',
+    'Total parsed DataFrame cache hits'
+)
+
+dataframe_cache_misses_total = Counter(
+    'dataframe_cache_misses_total',
+    'Total parsed DataFrame cache misses'
+)
+
+dataframe_cache_evictions_total = Counter(
+    'dataframe_cache_evictions_total',
+    'Total parsed DataFrame cache evictions',
+    ['reason']
+)
+
+dataframe_cache_bytes = Gauge(
+    'dataframe_cache_bytes',
+    'Estimated size in bytes of DataFrames held in the parsed DataFrame cache'
+)
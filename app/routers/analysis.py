@@ -1,141 +1,327 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
-import polars as pl
-import io
 import sys
 import os
 import asyncio
 import base64
-from uuid import UUID
-from datetime import datetime, timedelta
+import json
+from contextlib import aclosing
+from uuid import UUID, uuid4
+from datetime import datetime
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 
 from agent.agents.main_agent import run_main_agent
+from agent.tools.tools import Tools
 from app.db import get_db, crud, schemas
-from app.auth.dependencies import get_current_user
+from app.db.database import SessionLocal
+from app.auth.dependencies import get_current_user, get_current_user_ws
 from app.utils.quota import check_query_quota, decrement_query_usage, reset_monthly_quota, get_remaining_queries
-from app.config import subscription_limits
+from app.config import subscription_limits, dataset_config
+from app.utils.df_cache import dataframe_cache
+from app.utils.columnar import read_dataset, scan_dataset, is_out_of_core, load_value_index
+from app.utils.disconnect import cancel_on_disconnect
+from app.utils.plot_events import plot_events
+from app.utils.db_events import db_events
+from app.utils.conversation_memory import load_history, schedule_fold
+from app.storage import blob_store
+from app.routers.plots import plot_metadata
+from app.logger import app_logger
 
 router = APIRouter(tags=["analysis"])
 
-async def wait_for_plot_in_db(db: Session, request_id: str, timeout: int = 60):
-    """Poll database for plot with exponential backoff"""
-    end_time = datetime.utcnow() + timedelta(seconds=timeout)
-    wait_interval = 0.1
+def _invalidate_dataset(csv_id: UUID, dataset_hash: str) -> None:
+    dataframe_cache.invalidate(csv_id)
+    # Tools here is the module that builds this worker's query tools, so this is the result cache they use
+    if dataset_hash:
+        Tools.invalidate_cached_results(dataset_hash)
 
-    while datetime.utcnow() < end_time:
+# crud announces deletions and new plots; the caches and plot waiters this worker serves from follow them
+db_events.on_dataset_deleted(_invalidate_dataset)
+db_events.on_plot_saved(plot_events.publish)
+
+# Comment sent on idle streams so proxies keep them open (and WebSocket disconnects are noticed)
+STREAM_KEEPALIVE_SECONDS = 15
+
+async def wait_for_plot(db: Session, request_id: str, timeout: int = 60):
+    """Return the plot row once it is committed, woken by a plot event instead of polling"""
+    future = plot_events.subscribe(request_id)
+    try:
         plot = crud.get_plot_by_request_id(db, UUID(request_id))
+        if plot is None and await plot_events.wait(future, timeout):
+            plot = crud.get_plot_by_request_id(db, UUID(request_id))
+        return plot
+    finally:
+        plot_events.unsubscribe(request_id, future)
+
+async def prepare_analysis(db: Session, user_id: str, conversation_id: UUID, file: UploadFile, query: str):
+    """
+    Check the user's quota and the conversation's dataset, load the dataset and the
+    conversation's history and record the user's message. Returns (df, csv_file, tools, history)
+    for run_main_agent.
+    """
+    user = crud.get_user(db, UUID(user_id))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    reset_monthly_quota(db, user)
+
+    if not check_query_quota(user):
+        quota_info = get_remaining_queries(user)
+        monthly_limit = subscription_limits.FREE_QUERIES_PER_MONTH if user.subscription_tier == 'free' else subscription_limits.PRO_QUERIES_PER_MONTH
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={
+                "error": "Query quota exceeded",
+                "subscription_tier": user.subscription_tier,
+                "monthly_limit": monthly_limit,
+                "queries_used": user.queries_used_this_month,
+                "bonus_credits": user.bonus_credits,
+                "suggestion": "Upgrade to Pro or purchase bonus credits at /api/credits/purchase"
+            }
+        )
+
+    conversation = crud.get_conversation_by_id(db, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if str(conversation.user_id) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    if not conversation.csv_id:
+        if not file:
+            raise HTTPException(status_code=400, detail="No CSV linked. Please upload a CSV first.")
+        raise HTTPException(status_code=400, detail="Please use /conversations/{id}/upload-csv endpoint first")
+
+    if conversation.csv_expires_at and conversation.csv_expires_at < datetime.utcnow():
+        raise HTTPException(status_code=410, detail="CSV expired. Please re-upload via /conversations/{id}/upload-csv")
+
+    csv_file = crud.get_csv_by_id(db, conversation.csv_id)
+    if not csv_file:
+        raise HTTPException(status_code=404, detail="CSV file not found")
+
+    out_of_core = is_out_of_core(csv_file.file_size)
+    if out_of_core or dataset_config.ENGINE == "lazy":
+        df = await asyncio.to_thread(scan_dataset, csv_file)
+    else:
+        df = dataframe_cache.get(conversation.csv_id)
+        if df is None:
+            df = await asyncio.to_thread(read_dataset, csv_file)
+            dataframe_cache.put(conversation.csv_id, df, expires_at=conversation.csv_expires_at)
+
+    history = load_history(db, conversation)
+
+    crud.create_message(db, schemas.MessageCreate(
+        conversation_id=conversation_id,
+        role='user',
+        content=query
+    ))
+
+    value_index = await asyncio.to_thread(load_value_index, csv_file)
+    tools = Tools(
+        df,
+        out_of_core=out_of_core,
+        distinct_index=csv_file.distinct_index,
+        value_index=value_index,
+        dataset_hash=csv_file.csv_sha256
+    )
+    return df, csv_file, tools, history
+
+async def finish_analysis(db: Session, user_id: str, conversation_id: UUID, result: str, total_cost: float, is_plotting: bool, request_id: str, inline_plot: bool = False, queries: list = None) -> dict:
+    """
+    Store the answer with the SQL behind it (queries, for the conversation's memory), charge
+    usage and quota, and build the response body with the request's plots. Turns that left the
+    memory window are folded into the conversation's summary in the background.
+    """
+    assistant_message = crud.create_message(db, schemas.MessageCreate(
+        conversation_id=conversation_id,
+        role='assistant',
+        content=result,
+        cost=total_cost,
+        request_id=request_id,
+        is_plotting=is_plotting,
+        queries=list(dict.fromkeys(queries)) if queries else None
+    ))
+    schedule_fold(conversation_id)
+
+    conversation = crud.extend_csv_expiration(db, conversation_id)
+    dataframe_cache.extend_expiration(conversation.csv_id, conversation.csv_expires_at)
+
+    crud.create_usage_tracking(db, schemas.UsageTrackingCreate(
+        user_id=UUID(user_id),
+        message_id=assistant_message.id,
+        cost=total_cost,
+        model_used="grok-4-reasoning-fast"
+    ))
+
+    decrement_query_usage(db, crud.get_user(db, UUID(user_id)))
+
+    response_data = {
+        "response": result,
+        "is_plotting": is_plotting,
+        "cost": total_cost,
+        "request_id": request_id,
+        "message_id": str(assistant_message.id),
+        "status": "success"
+    }
+
+    if is_plotting and request_id:
+        plot = await wait_for_plot(db, request_id, timeout=60)
+        response_data["plot_url"] = f"/api/plots/{request_id}"
         if plot:
-            return plot.image_data
+            plots = crud.attach_plots_to_message(db, UUID(request_id), assistant_message.id)
+            response_data["plots"] = jsonable_encoder([plot_metadata(p) for p in plots])
+            if plot.spec is not None:
+                response_data["chart_spec"] = plot.spec
+            if inline_plot and plot.image_blob_key is not None:
+                plot_data = await asyncio.to_thread(blob_store.get_bytes, plot.image_blob_key)
+                response_data["plot_image"] = base64.b64encode(plot_data).decode('utf-8')
+            response_data["plot_status"] = "ready"
+        else:
+            response_data["plot_status"] = "processing"
 
-        await asyncio.sleep(wait_interval)
-        wait_interval = min(wait_interval * 1.5, 2)
-        db.expire_all()
+    return response_data
+
+async def analysis_events(user_id: str, conversation_id: UUID, query: str, df, csv_file, tools: Tools, history, inline_plot: bool = False):
+    """
+    Run the agent in a task and yield its progress events as they happen: started (with the
+    request_id), step_started/step_finished, token, tool_started/tool_finished, sql, plot_ready
+    and budget_exhausted, keepalive while nothing happens, then done with the same body as
+    POST / (or error). Closing the generator, e.g. because the client left, cancels the agent.
+    """
+    request_id = str(uuid4())
+    queue = asyncio.Queue()
+    task = asyncio.create_task(run_main_agent(
+        df,
+        input=query,
+        profile=csv_file.profile,
+        tools=tools,
+        request_id=request_id,
+        on_event=queue.put_nowait,
+        tenant=user_id,
+        history=history
+    ))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    # The request's session is closed once a streaming response starts
+    db = SessionLocal()
+    try:
+        yield {"type": "started", "request_id": request_id}
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield {"type": "keepalive"}
+                continue
+            if event is None:
+                break
+            if event["type"] == "plot_ready":
+                plot = crud.get_plot_by_request_id(db, UUID(request_id), event["position"])
+                if plot is None:
+                    continue
+                event = {**event, "plot": jsonable_encoder(plot_metadata(plot)), "spec": plot.spec}
+            yield event
+        result, total_cost, is_plotting, _ = task.result()
+        response_data = await finish_analysis(db, user_id, conversation_id, result, total_cost, is_plotting, request_id, inline_plot, tools.queries)
+        yield {"type": "done", **response_data}
+    except Exception as e:
+        app_logger.error("Streaming analysis failed", extra={"request_id": request_id, "error": str(e)})
+        yield {"type": "error", "status_code": 500, "detail": str(e)}
+    finally:
+        task.cancel()
+        db.close()
 
-    return None
+def format_sse(event: dict) -> str:
+    if event["type"] == "keepalive":
+        return ": keepalive\n\n"
+    return f"event: {event['type']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
 
 @router.post("/")
 async def call_agent_api(
+    request: Request,
     conversation_id: UUID = Form(...),
     file: UploadFile = File(None),
     query: str = Form(...),
+    inline_plot: bool = Form(False),
     user_id: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Run data analysis on uploaded CSV file within a conversation"""
+    """
+    Run data analysis on uploaded CSV file within a conversation.
+    Every plot of the request is listed in plots (metadata and URLs; clients fetch the
+    images lazily). plot_url, chart_spec and, with inline_plot, the base64 plot_image
+    describe the first plot.
+    """
     try:
-        user = crud.get_user(db, UUID(user_id))
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        reset_monthly_quota(db, user)
-
-        if not check_query_quota(user):
-            quota_info = get_remaining_queries(user)
-            monthly_limit = subscription_limits.FREE_QUERIES_PER_MONTH if user.subscription_tier == 'free' else subscription_limits.PRO_QUERIES_PER_MONTH
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail={
-                    "error": "Query quota exceeded",
-                    "subscription_tier": user.subscription_tier,
-                    "monthly_limit": monthly_limit,
-                    "queries_used": user.queries_used_this_month,
-                    "bonus_credits": user.bonus_credits,
-                    "suggestion": "Upgrade to Pro or purchase bonus credits at /api/credits/purchase"
-                }
-            )
-
-        conversation = crud.get_conversation_by_id(db, conversation_id)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-        if str(conversation.user_id) != user_id:
-            raise HTTPException(status_code=403, detail="Not authorized")
-
-        if not conversation.csv_id:
-            if not file:
-                raise HTTPException(status_code=400, detail="No CSV linked. Please upload a CSV first.")
-            raise HTTPException(status_code=400, detail="Please use /conversations/{id}/upload-csv endpoint first")
-
-        if conversation.csv_expires_at and conversation.csv_expires_at < datetime.utcnow():
-            raise HTTPException(status_code=410, detail="CSV expired. Please re-upload via /conversations/{id}/upload-csv")
-
-        csv_file = crud.get_csv_by_id(db, conversation.csv_id)
-        if not csv_file:
-            raise HTTPException(status_code=404, detail="CSV file not found")
-
-        df = pl.read_csv(io.BytesIO(csv_file.csv_data))
-
-        user_message = crud.create_message(db, schemas.MessageCreate(
-            conversation_id=conversation_id,
-            role='user',
-            content=query
-        ))
-
-        result, total_cost, is_plotting, request_id = await run_main_agent(df, input=query)
-
-        assistant_message = crud.create_message(db, schemas.MessageCreate(
-            conversation_id=conversation_id,
-            role='assistant',
-            content=result,
-            cost=total_cost,
-            request_id=request_id,
-            is_plotting=is_plotting
-        ))
-
-        crud.extend_csv_expiration(db, conversation_id)
+        df, csv_file, tools, history = await prepare_analysis(db, user_id, conversation_id, file, query)
 
-        crud.create_usage_tracking(db, schemas.UsageTrackingCreate(
-            user_id=UUID(user_id),
-            message_id=assistant_message.id,
-            cost=total_cost,
-            model_used="grok-4-reasoning-fast"
+        result, total_cost, is_plotting, request_id = await cancel_on_disconnect(request, run_main_agent(
+            df,
+            input=query,
+            profile=csv_file.profile,
+            tools=tools,
+            tenant=user_id,
+            history=history
         ))
 
-        decrement_query_usage(db, user)
-
-        response_data = {
-            "response": result,
-            "is_plotting": is_plotting,
-            "cost": total_cost,
-            "request_id": request_id,
-            "message_id": str(assistant_message.id),
-            "status": "success"
-        }
-
-        if is_plotting and request_id:
-            plot_data = await wait_for_plot_in_db(db, request_id, timeout=60)
-            if plot_data:
-                plot = crud.get_plot_by_request_id(db, UUID(request_id))
-                plot.message_id = assistant_message.id
-                db.commit()
-                response_data["plot_image"] = base64.b64encode(plot_data).decode('utf-8')
-                response_data["plot_status"] = "ready"
-            else:
-                response_data["plot_status"] = "processing"
-
+        response_data = await finish_analysis(db, user_id, conversation_id, result, total_cost, is_plotting, request_id, inline_plot, tools.queries)
         return JSONResponse(content=response_data)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream")
+async def stream_agent_api(
+    conversation_id: UUID = Form(...),
+    file: UploadFile = File(None),
+    query: str = Form(...),
+    inline_plot: bool = Form(False),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    POST / as Server-Sent Events: the agent's progress and answer tokens stream as they
+    happen, each event named by its type with a JSON payload; the final done event carries
+    the same body as POST /. Quota and dataset errors are returned before the stream starts.
+    """
+    try:
+        df, csv_file, tools, history = await prepare_analysis(db, user_id, conversation_id, file, query)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    events = analysis_events(user_id, conversation_id, query, df, csv_file, tools, history, inline_plot)
+    return StreamingResponse(
+        (format_sse(event) async for event in events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def analysis_websocket(websocket: WebSocket, user_id: str = Depends(get_current_user_ws), db: Session = Depends(get_db)):
+    """
+    The streaming analysis over a WebSocket. Send {"conversation_id", "query", "inline_plot"}
+    and receive the same events as /stream as JSON objects with a type, ending with done or
+    error; then the next query can be sent. Disconnecting cancels the running analysis.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_json()
+            try:
+                conversation_id = UUID(str(message["conversation_id"]))
+                query = str(message["query"])
+                df, csv_file, tools, history = await prepare_analysis(db, user_id, conversation_id, None, query)
+            except HTTPException as e:
+                await websocket.send_json(jsonable_encoder({"type": "error", "status_code": e.status_code, "detail": e.detail}))
+                continue
+            except (KeyError, TypeError, ValueError):
+                await websocket.send_json({"type": "error", "status_code": 400, "detail": "Send a JSON object with conversation_id and query"})
+                continue
+
+            async with aclosing(analysis_events(user_id, conversation_id, query, df, csv_file, tools, history, bool(message.get("inline_plot")))) as events:
+                async for event in events:
+                    await websocket.send_json(jsonable_encoder(event))
+    except WebSocketDisconnect:
+        pass
@@ -4,11 +4,15 @@ from typing import List
 from uuid import UUID
 from datetime import datetime, timedelta
 import polars as pl
-import io
+import asyncio
+import os
 
 from app.db import get_db, crud, schemas
 from app.db.models import Conversation, CSVFile
 from app.auth.dependencies import get_current_user
+from app.utils.columnar import csv_to_parquet, schema_to_json, profile_parquet, index_parquet, value_index_parquet, is_out_of_core
+from app.utils.uploads import spool_upload
+from app.storage import blob_response
 
 router = APIRouter(tags=["conversations"])
 
@@ -90,20 +94,40 @@ async def upload_csv(
     if str(conversation.user_id) != user_id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    csv_bytes = await file.read()
-    df = pl.read_csv(io.BytesIO(csv_bytes))
-
-    csv_data = schemas.CSVFileCreate(
-        conversation_id=conversation_id,
-        filename=file.filename,
-        file_size=len(csv_bytes),
-        row_count=df.shape[0],
-        column_names=df.columns,
-        csv_data=csv_bytes,
-        expires_at=datetime.utcnow() + timedelta(weeks=1)
-    )
-
-    csv_file = crud.create_csv_file(db, user_id=UUID(user_id), csv_data=csv_data)
+    upload = await spool_upload(file, suffix=".csv")
+    parquet_path = upload.path + ".parquet"
+    value_index_path = upload.path + ".values.parquet"
+    try:
+        try:
+            schema, row_count = await asyncio.to_thread(csv_to_parquet, upload.path, parquet_path)
+        except pl.exceptions.PolarsError as e:
+            raise HTTPException(status_code=400, detail=f"Could not parse CSV: {str(e)}")
+        out_of_core = is_out_of_core(upload.size)
+        profile = await asyncio.to_thread(profile_parquet, parquet_path, out_of_core)
+        distinct_index = await asyncio.to_thread(index_parquet, parquet_path, out_of_core)
+        await asyncio.to_thread(value_index_parquet, parquet_path, value_index_path, out_of_core)
+
+        csv_data = schemas.CSVFileCreate(
+            conversation_id=conversation_id,
+            filename=file.filename,
+            row_count=row_count,
+            column_names=schema.names(),
+            csv_path=upload.path,
+            csv_sha256=upload.sha256,
+            parquet_path=parquet_path,
+            column_schema=schema_to_json(schema),
+            profile=profile,
+            distinct_index=distinct_index,
+            value_index_path=value_index_path,
+            expires_at=datetime.utcnow() + timedelta(weeks=1)
+        )
+
+        csv_file = await asyncio.to_thread(crud.create_csv_file, db, UUID(user_id), csv_data)
+    finally:
+        upload.cleanup()
+        for path in (parquet_path, value_index_path):
+            if os.path.exists(path):
+                os.remove(path)
 
     crud.link_csv_to_conversation(
         db,
@@ -134,3 +158,25 @@ async def get_conversation_csv(
         raise HTTPException(status_code=404, detail="CSV file not found")
 
     return csv_file
+
+@router.get("/{conversation_id}/csv/download")
+async def download_conversation_csv(
+    conversation_id: UUID,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download the originally uploaded CSV file"""
+    conversation = crud.get_conversation_by_id(db, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if str(conversation.user_id) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    if not conversation.csv_id:
+        raise HTTPException(status_code=404, detail="No CSV linked to this conversation")
+
+    csv_file = crud.get_csv_by_id(db, conversation.csv_id)
+    if not csv_file:
+        raise HTTPException(status_code=404, detail="CSV file not found")
+
+    return blob_response(csv_file.csv_blob_key, media_type="text/csv", filename=csv_file.filename)
@@ -1,15 +1,87 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
+from typing import List, Optional
 from uuid import UUID
-from app.db import get_db, crud
+import asyncio
+from app.db import get_db, crud, schemas
+from app.db.models import Plot
+from app.storage import blob_store, immutable_blob_response
+from app.config import plot_variant_config
+from app.utils.thumbnails import webp_variant
+from agent.tools.chart import render_chart_png
 
 router = APIRouter(tags=["plots"])
 
-@router.get("/{request_id}")
-async def get_plot(request_id: UUID, db: Session = Depends(get_db)):
-    """Fallback endpoint to poll for plot if it wasn't ready in analysis response"""
-    plot = crud.get_plot_by_request_id(db, request_id)
+def plot_metadata(plot: Plot) -> dict:
+    """Plot listing entry; image bytes are fetched separately from image_url"""
+    base = f"/api/plots/{plot.request_id}/{plot.position}"
+    return {
+        "id": plot.id,
+        "message_id": plot.message_id,
+        "request_id": plot.request_id,
+        "position": plot.position,
+        "kind": plot.kind,
+        "image_size": plot.image_size,
+        "image_url": base,
+        "thumbnail_url": f"{base}?width={min(plot_variant_config.WIDTHS)}" if plot_variant_config.WIDTHS else base,
+        "spec_url": f"{base}/spec" if plot.spec is not None else None,
+        "created_at": plot.created_at
+    }
+
+async def _image_response(request: Request, plot: Plot, db: Session, width: Optional[int]):
+    """
+    The plot's PNG, or its WebP variant at width. Charts are rasterized and variants encoded
+    on first request and stored; everything is served immutable with the content hash as ETag.
+    """
+    if not plot:
+        raise HTTPException(status_code=404, detail="Plot not ready yet")
+    if width is not None and width not in plot_variant_config.WIDTHS:
+        raise HTTPException(status_code=400, detail=f"width must be one of {plot_variant_config.WIDTHS}")
+    if plot.image_blob_key is None:
+        png = await asyncio.to_thread(render_chart_png, plot.spec)
+        plot = await asyncio.to_thread(crud.set_plot_image, db, plot, png)
+    if width is None:
+        return immutable_blob_response(request, plot.image_blob_key, plot.image_sha256, media_type="image/png")
+
+    variant = (plot.variants or {}).get(str(width))
+    if variant is None:
+        png = await asyncio.to_thread(blob_store.get_bytes, plot.image_blob_key)
+        webp = await asyncio.to_thread(webp_variant, png, width, plot_variant_config.WEBP_QUALITY)
+        plot = await asyncio.to_thread(crud.set_plot_variant, db, plot, width, webp)
+        variant = plot.variants[str(width)]
+    return immutable_blob_response(request, variant["key"], variant["sha256"], media_type="image/webp")
+
+def _spec_response(plot: Plot):
     if not plot:
         raise HTTPException(status_code=404, detail="Plot not ready yet")
-    return Response(content=plot.image_data, media_type="image/png")
+    if plot.spec is None:
+        raise HTTPException(status_code=404, detail="Plot is an image, not a chart")
+    return plot.spec
+
+@router.get("/{request_id}/list", response_model=List[schemas.PlotResponse])
+async def list_plots(request_id: UUID, db: Session = Depends(get_db)):
+    """All plots of an analysis request in order, with URLs for their images and specs"""
+    return [plot_metadata(plot) for plot in crud.get_plots_by_request_id(db, request_id)]
+
+@router.get("/{request_id}")
+async def get_plot(request: Request, request_id: UUID, width: Optional[int] = Query(None), db: Session = Depends(get_db)):
+    """
+    Fallback endpoint to poll for plot if it wasn't ready in analysis response (first plot of the request).
+    Charts are rendered to PNG from their spec on first request (exports) and stored.
+    """
+    return await _image_response(request, crud.get_plot_by_request_id(db, request_id), db, width)
+
+@router.get("/{request_id}/spec")
+async def get_chart_spec(request_id: UUID, db: Session = Depends(get_db)):
+    """Vega-Lite spec of the request's first plot, if it is a chart"""
+    return _spec_response(crud.get_plot_by_request_id(db, request_id))
+
+@router.get("/{request_id}/{position}")
+async def get_plot_at(request: Request, request_id: UUID, position: int, width: Optional[int] = Query(None), db: Session = Depends(get_db)):
+    """Image of the plot at position within the request; ?width= for a downscaled WebP"""
+    return await _image_response(request, crud.get_plot_by_request_id(db, request_id, position), db, width)
+
+@router.get("/{request_id}/{position}/spec")
+async def get_chart_spec_at(request_id: UUID, position: int, db: Session = Depends(get_db)):
+    """Vega-Lite spec of the plot at position within the request, if it is a chart"""
+    return _spec_response(crud.get_plot_by_request_id(db, request_id, position))
@@ -0,0 +1,12 @@
+from app.storage.blob_store import BlobRef, BlobStore, LocalBlobStore, S3BlobStore, blob_store
+from app.storage.responses import blob_response, immutable_blob_response
+
+__all__ = [
+    "BlobRef",
+    "BlobStore",
+    "LocalBlobStore",
+    "S3BlobStore",
+    "blob_store",
+    "blob_response",
+    "immutable_blob_response"
+]
@@ -0,0 +1,248 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional
+
+from app.config import blob_store_config
+
+CHUNK_SIZE = 1024 * 1024
+
+@dataclass(frozen=True)
+class BlobRef:
+    """Location and fingerprint of a stored blob"""
+    key: str
+    size: int
+    sha256: str
+
+def blob_key(sha256: str) -> str:
+    """Content-addressed key for a SHA-256 digest"""
+    return f"sha256/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class BlobStore(ABC):
+    """Content-addressed blob storage: identical content is stored once under its SHA-256"""
+
+    def put_bytes(self, data: bytes) -> BlobRef:
+        sha256 = hashlib.sha256(data).hexdigest()
+        key = blob_key(sha256)
+        if not self.exists(key):
+            self._write_bytes(key, data)
+        return BlobRef(key=key, size=len(data), sha256=sha256)
+
+    def put_file(self, path: str, sha256: Optional[str] = None) -> BlobRef:
+        """Store a file from disk without loading it into memory"""
+        if sha256 is None:
+            sha256 = sha256_file(path)
+        key = blob_key(sha256)
+        if not self.exists(key):
+            self._write_file(key, path)
+        return BlobRef(key=key, size=os.path.getsize(path), sha256=sha256)
+
+    def get_bytes(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(key) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of the blob if the backend has one (enables mmap/scan), else None"""
+        return None
+
+    def cached_path(self, key: str) -> str:
+        """
+        A local file with the blob's content, for scanning without reading it into memory: the
+        blob itself on local backends, else a copy streamed once per host into the blob cache.
+        """
+        path = self.local_path(key)
+        if path:
+            return path
+        return blob_cache.fetch(self, key)
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def _write_bytes(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _write_file(self, key: str, path: str) -> None:
+        ...
+
+class LocalBlobStore(BlobStore):
+    """Blob store backed by a local directory"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _write_bytes(self, key: str, data: bytes) -> None:
+        with self._atomic_target(key) as f:
+            f.write(data)
+
+    def _write_file(self, key: str, path: str) -> None:
+        with self._atomic_target(key) as f, open(path, "rb") as src:
+            shutil.copyfileobj(src, f, CHUNK_SIZE)
+
+    def _atomic_target(self, key: str):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return _AtomicFile(target)
+
+class _AtomicFile:
+    """Write to a temp file in the target directory and rename into place on success"""
+
+    def __init__(self, target: str):
+        self.target = target
+
+    def __enter__(self) -> BinaryIO:
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.target), suffix=".tmp")
+        self.file = os.fdopen(fd, "wb")
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.target)
+        else:
+            os.remove(self.tmp_path)
+        return False
+
+class BlobCache:
+    """
+    Host-wide directory of downloaded blobs, shared by workers. Keys are content addresses,
+    so a cached copy never goes stale; the least recently used copies are removed once the
+    directory passes max_bytes, except those used within MIN_IDLE_SECONDS (likely still
+    being scanned).
+    """
+    MIN_IDLE_SECONDS = 600
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+
+    def fetch(self, store: BlobStore, key: str) -> str:
+        path = os.path.join(self.root, *key.split("/"))
+        if os.path.exists(path):
+            # Recency for LRU eviction
+            os.utime(path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _AtomicFile(path) as f:
+            for chunk in store.iter_chunks(key):
+                f.write(chunk)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str) -> None:
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep or now - mtime < self.MIN_IDLE_SECONDS:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+class S3BlobStore(BlobStore):
+    """Blob store backed by an S3-compatible bucket (AWS S3, MinIO, moto server, ...)"""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, prefix: str = ""):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def _write_bytes(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def _write_file(self, key: str, path: str) -> None:
+        self.client.upload_file(path, self.bucket, self._object_key(key))
+
+def create_blob_store() -> BlobStore:
+    if blob_store_config.BACKEND == "s3":
+        return S3BlobStore(
+            bucket=blob_store_config.S3_BUCKET,
+            endpoint_url=blob_store_config.S3_ENDPOINT_URL,
+            prefix=blob_store_config.S3_PREFIX
+        )
+    return LocalBlobStore(blob_store_config.LOCAL_PATH)
+
+blob_cache = BlobCache(blob_store_config.CACHE_PATH, blob_store_config.CACHE_MAX_BYTES)
+blob_store = create_blob_store()
@@ -0,0 +1,31 @@
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Dict, Optional
+
+from app.storage.blob_store import blob_store
+
+def blob_response(key: str, media_type: str, filename: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+    """Stream a blob to the client, using sendfile when the backend has a local path"""
+    headers = dict(headers or {})
+    path = blob_store.local_path(key)
+    if path:
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(blob_store.iter_chunks(key), media_type=media_type, headers=headers)
+
+# Blobs are content-addressed, so a given key never changes
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def immutable_blob_response(request: Request, key: str, sha256: str, media_type: str):
+    """Serve a content-addressed blob with a strong ETag (its hash), immutable caching and 304s"""
+    headers = {"ETag": f'"{sha256}"', "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return blob_response(key, media_type=media_type, headers=headers)
@@ -0,0 +1,66 @@
+import polars as pl
+import io
+from typing import Dict, List, Optional, Tuple
+
+from agent.tools.tools import Tools
+from app.config import dataset_config
+from app.db.models import CSVFile
+from app.storage import blob_store
+
+PARQUET_COMPRESSION = "zstd"
+
+def schema_to_json(schema: pl.Schema) -> Dict[str, str]:
+    """Serialize a polars schema as {column: dtype} for storage in a JSON column"""
+    return {name: str(dtype) for name, dtype in schema.items()}
+
+def csv_to_parquet(csv_path: str, parquet_path: str) -> Tuple[pl.Schema, int]:
+    """Stream a CSV file into zstd-compressed Parquet, returning its schema and row count"""
+    lf = pl.scan_csv(csv_path)
+    schema = lf.collect_schema()
+    lf.sink_parquet(parquet_path, compression=PARQUET_COMPRESSION)
+    row_count = pl.scan_parquet(parquet_path).select(pl.len()).collect().item()
+    return schema, row_count
+
+def is_out_of_core(file_size: int) -> bool:
+    """Datasets above the threshold are never fully materialized in the worker"""
+    return file_size > dataset_config.OUT_OF_CORE_THRESHOLD_BYTES
+
+def profile_parquet(parquet_path: str, out_of_core: bool = False) -> dict:
+    """Compute the agent's dataset profile (describe/head/tail/schema) once, at upload time"""
+    return Tools(pl.scan_parquet(parquet_path), out_of_core=out_of_core).profile()
+
+def index_parquet(parquet_path: str, out_of_core: bool = False) -> dict:
+    """Build the distinct-value index for low-cardinality columns once, at upload time"""
+    return Tools(pl.scan_parquet(parquet_path), out_of_core=out_of_core).build_distinct_index()
+
+def value_index_parquet(parquet_path: str, index_path: str, out_of_core: bool = False) -> None:
+    """Build the trigram value index once, at upload time, and write it as Parquet"""
+    index = Tools(pl.scan_parquet(parquet_path), out_of_core=out_of_core).build_value_index()
+    index.write_parquet(index_path, compression=PARQUET_COMPRESSION)
+
+def load_value_index(csv_file: CSVFile) -> Optional[pl.LazyFrame]:
+    """Scan the stored trigram index so lookups only read the searched column's postings"""
+    if not csv_file.value_index_blob_key:
+        return None
+    return pl.scan_parquet(blob_store.cached_path(csv_file.value_index_blob_key))
+
+def read_dataset(csv_file: CSVFile, columns: Optional[List[str]] = None) -> pl.DataFrame:
+    """Load a stored dataset, preferring the columnar copy over the original CSV"""
+    if csv_file.parquet_blob_key:
+        path = blob_store.local_path(csv_file.parquet_blob_key)
+        if path:
+            return pl.read_parquet(path, columns=columns, memory_map=True)
+        return pl.read_parquet(io.BytesIO(blob_store.get_bytes(csv_file.parquet_blob_key)), columns=columns)
+    path = blob_store.local_path(csv_file.csv_blob_key)
+    source = path if path else io.BytesIO(blob_store.get_bytes(csv_file.csv_blob_key))
+    return pl.read_csv(source, columns=columns)
+
+def scan_dataset(csv_file: CSVFile) -> pl.LazyFrame:
+    """
+    Lazily scan a stored dataset so queries only materialize the columns and rows they need.
+    Remote blobs are streamed to the host's blob cache and scanned there, never read into the
+    worker, which is what keeps out-of-core datasets out of its memory.
+    """
+    if csv_file.parquet_blob_key:
+        return pl.scan_parquet(blob_store.cached_path(csv_file.parquet_blob_key))
+    return pl.scan_csv(blob_store.cached_path(csv_file.csv_blob_key))
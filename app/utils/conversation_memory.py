@@ -0,0 +1,73 @@
+import asyncio
+from uuid import UUID
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.database import SessionLocal
+from app.db.models import Conversation
+from app.logger import app_logger
+from agent.agents.main_agent import MEMORY, MODEL_MAIN
+from agent.agents.memory import History, group_turns, split_window, summarize_turns
+
+# Messages read to find the newest turns; leaves room for unanswered questions between them
+RECENT_MESSAGES = 4 * (MEMORY.keep_turns + 1)
+
+# Running folds by conversation, so a worker folds each conversation once at a time
+_folds: dict = {}
+
+def load_history(db: Session, conversation: Conversation) -> History:
+    """
+    The conversation so far for the main agent, read before the new question is stored: the
+    stored running summary plus the newest turns after it verbatim. One turn beyond the window
+    is allowed, since the turn that just left it is folded after its request has answered.
+    """
+    messages = crud.get_recent_conversation_messages(db, conversation.id, RECENT_MESSAGES, after=conversation.summarized_until)
+    _, recent = split_window(group_turns(messages), MEMORY, extra_turns=1)
+    return History(summary=conversation.summary, turns=recent, max_queries=MEMORY.max_queries_per_turn)
+
+async def fold_history(conversation_id: UUID) -> None:
+    """
+    Fold the turns older than the memory window into the conversation's running summary, at
+    most fold_batch_turns per model call, until only the window is left unsummarized. Each
+    batch is stored with a compare-and-set on summarized_until, so concurrent folds (other
+    workers) never overwrite each other; the one that loses stops.
+    """
+    db = SessionLocal()
+    try:
+        while True:
+            conversation = crud.get_conversation_by_id(db, conversation_id)
+            if conversation is None:
+                return
+            previous_until = conversation.summarized_until
+            newest = crud.get_recent_conversation_messages(db, conversation_id, RECENT_MESSAGES, after=previous_until)
+            _, window = split_window(group_turns(newest), MEMORY)
+            window_start = window[0].started_at if window else None
+
+            backlog = crud.get_conversation_messages(db, conversation_id, limit=2 * MEMORY.fold_batch_turns, after=previous_until)
+            backlog = [m for m in backlog if window_start is None or m.created_at < window_start]
+            if not backlog:
+                return
+            turns = group_turns(backlog)[:MEMORY.fold_batch_turns]
+            if turns:
+                summary, _ = await summarize_turns(conversation.summary, turns, MODEL_MAIN, MEMORY)
+                if not summary:
+                    return
+                until = turns[-1].ended_at
+            else:
+                # Only unanswered questions: skip past them without a model call
+                summary, until = conversation.summary, backlog[-1].created_at
+            if not crud.update_conversation_summary(db, conversation_id, summary, until, previous_until):
+                return
+            db.expire_all()
+    except Exception as e:
+        app_logger.warning("Failed to update conversation summary", extra={"conversation_id": str(conversation_id), "error": str(e)})
+    finally:
+        db.close()
+
+def schedule_fold(conversation_id: UUID) -> None:
+    """Fold the conversation's history in the background, unless this worker already is"""
+    if conversation_id in _folds:
+        return
+    task = asyncio.create_task(fold_history(conversation_id))
+    _folds[conversation_id] = task
+    task.add_done_callback(lambda _: _folds.pop(conversation_id, None))
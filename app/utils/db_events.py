@@ -0,0 +1,38 @@
+from app.logger import app_logger
+
+class DbEvents:
+    """
+    Callbacks run after crud commits a change that other layers keep state about (caches,
+    plot waiters). crud only announces the change; whoever owns the state registers here,
+    so the data layer doesn't import the agent or any cache.
+    """
+
+    def __init__(self):
+        self._dataset_deleted = []
+        self._plot_saved = []
+
+    def on_dataset_deleted(self, callback) -> None:
+        """callback(csv_id, dataset_hash), after a dataset is marked deleted"""
+        self._dataset_deleted.append(callback)
+
+    def on_plot_saved(self, callback) -> None:
+        """callback(request_id), after a plot is committed"""
+        self._plot_saved.append(callback)
+
+    def dataset_deleted(self, csv_id, dataset_hash: str) -> None:
+        self._run(self._dataset_deleted, csv_id, dataset_hash)
+
+    def plot_saved(self, request_id: str) -> None:
+        self._run(self._plot_saved, request_id)
+
+    @staticmethod
+    def _run(callbacks: list, *args) -> None:
+        # The change is already committed; one failing listener must not skip the others
+        for callback in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                app_logger.warning("DB event listener failed", extra={"listener": getattr(callback, "__qualname__", repr(callback)), "error": str(e)})
+
+
+db_events = DbEvents()
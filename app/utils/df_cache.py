@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+import polars as pl
+
+from app.config import dataframe_cache_config
+from app.metrics import (
+    dataframe_cache_hits_total,
+    dataframe_cache_misses_total,
+    dataframe_cache_evictions_total,
+    dataframe_cache_bytes
+)
+
+class _CacheEntry:
+    __slots__ = ("df", "size", "expires_at")
+
+    def __init__(self, df: pl.DataFrame, size: int, expires_at: Optional[datetime]):
+        self.df = df
+        self.size = size
+        self.expires_at = expires_at
+
+    def is_expired(self, now: datetime) -> bool:
+        return self.expires_at is not None and self.expires_at < now
+
+class DataFrameCache:
+    """LRU cache of parsed DataFrames keyed by csv_id, bounded by estimated size in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, csv_id: UUID) -> Optional[pl.DataFrame]:
+        """Return the cached DataFrame for csv_id, or None on a miss"""
+        key = str(csv_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.is_expired(datetime.utcnow()):
+                self._evict(key, "expired")
+                entry = None
+            if entry is None:
+                dataframe_cache_misses_total.inc()
+                return None
+            self._entries.move_to_end(key)
+            dataframe_cache_hits_total.inc()
+            return entry.df
+
+    def put(self, csv_id: UUID, df: pl.DataFrame, expires_at: Optional[datetime] = None) -> None:
+        """Cache df for csv_id, evicting expired then least recently used entries to stay in budget"""
+        key = str(csv_id)
+        size = int(df.estimated_size())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key, "replaced")
+            self._purge_expired()
+            while self._entries and self._total_bytes + size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._evict(oldest_key, "lru")
+            self._entries[key] = _CacheEntry(df, size, expires_at)
+            self._total_bytes += size
+            dataframe_cache_bytes.set(self._total_bytes)
+
+    def extend_expiration(self, csv_id: UUID, expires_at: Optional[datetime]) -> None:
+        """Keep a cached entry alive in step with the conversation's CSV expiry"""
+        with self._lock:
+            entry = self._entries.get(str(csv_id))
+            if entry is not None:
+                entry.expires_at = expires_at
+
+    def invalidate(self, csv_id: UUID, reason: str = "deleted") -> None:
+        """Drop csv_id from the cache if present"""
+        with self._lock:
+            key = str(csv_id)
+            if key in self._entries:
+                self._evict(key, reason)
+
+    def _purge_expired(self) -> None:
+        now = datetime.utcnow()
+        expired = [key for key, entry in self._entries.items() if entry.is_expired(now)]
+        for key in expired:
+            self._evict(key, "expired")
+
+    def _evict(self, key: str, reason: str) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+        dataframe_cache_evictions_total.labels(reason=reason).inc()
+        dataframe_cache_bytes.set(self._total_bytes)
+
+dataframe_cache = DataFrameCache(max_bytes=dataframe_cache_config.MAX_BYTES)
@@ -0,0 +1,122 @@
+import asyncio
+import select
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from sqlalchemy import text
+
+from app.config import plot_events_config
+from app.logger import app_logger
+
+class PlotEvents(ABC):
+    """
+    Wakes requests waiting for a plot the moment it is committed, instead of polling the DB.
+    Waiters are asyncio futures keyed by request_id; publish() may be called from any thread.
+    Backends decide how a publish reaches waiters in other workers.
+    """
+
+    def __init__(self):
+        self._waiters: dict[str, set[asyncio.Future]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, request_id: str) -> asyncio.Future:
+        """Register interest before checking the DB, so a publish in between isn't missed"""
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters[request_id].add(future)
+        return future
+
+    def unsubscribe(self, request_id: str, future: asyncio.Future) -> None:
+        with self._lock:
+            waiters = self._waiters.get(request_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[request_id]
+
+    async def wait(self, future: asyncio.Future, timeout: float) -> bool:
+        """Wait for a subscribed future; False on timeout"""
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _deliver(self, request_id: str) -> None:
+        with self._lock:
+            waiters = list(self._waiters.get(request_id, ()))
+        for future in waiters:
+            future.get_loop().call_soon_threadsafe(_resolve, future)
+
+    @abstractmethod
+    def publish(self, request_id: str) -> None:
+        """Announce that the plot for request_id has been committed"""
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+class LocalPlotEvents(PlotEvents):
+    """In-process delivery; enough when plots are saved by the worker that waits for them"""
+
+    def publish(self, request_id: str) -> None:
+        self._deliver(request_id)
+
+class PostgresPlotEvents(PlotEvents):
+    """Cross-worker delivery over Postgres LISTEN/NOTIFY on a dedicated listener connection"""
+
+    def __init__(self, engine, channel: str):
+        super().__init__()
+        self.engine = engine
+        self.channel = channel
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        self._listening = threading.Event()
+
+    def subscribe(self, request_id: str) -> asyncio.Future:
+        self._ensure_listener()
+        return super().subscribe(request_id)
+
+    def publish(self, request_id: str) -> None:
+        self._deliver(request_id)
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": request_id})
+                conn.commit()
+        except Exception as e:
+            # The plot is already committed; waiters in other workers fall back to their timeout
+            app_logger.warning("Failed to publish plot event", extra={"request_id": request_id, "error": str(e)})
+
+    def _ensure_listener(self) -> None:
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listening.clear()
+                self._listener = threading.Thread(target=self._listen, name="plot-events-listener", daemon=True)
+                self._listener.start()
+                # Don't let the first waiter check the DB before LISTEN is in effect
+                self._listening.wait(5)
+
+    def _listen(self) -> None:
+        raw = self.engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            self._listening.set()
+            while True:
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._deliver(conn.notifies.pop(0).payload)
+        finally:
+            raw.close()
+
+def create_plot_events() -> PlotEvents:
+    if plot_events_config.BACKEND == "postgres":
+        from app.db.database import engine
+        return PostgresPlotEvents(engine, plot_events_config.CHANNEL)
+    return LocalPlotEvents()
+
+plot_events = create_plot_events()
@@ -0,0 +1,13 @@
+import io
+
+def webp_variant(image_data: bytes, width: int, quality: int) -> bytes:
+    """Downscale an image to width (keeping aspect ratio, never upscaling) and encode it as WebP"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_data)) as image:
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        image.save(buf, format="WEBP", quality=quality, method=4)
+        return buf.getvalue()
@@ -0,0 +1,46 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile, status
+
+from app.config import upload_config
+
+CHUNK_SIZE = 1024 * 1024
+
+@dataclass
+class SpooledUpload:
+    """Upload written to a local temp file, hashed on the way through"""
+    path: str
+    size: int
+    sha256: str
+
+    def cleanup(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+async def spool_upload(file: UploadFile, max_bytes: int = None, suffix: str = "") -> SpooledUpload:
+    """Copy an upload to disk chunk by chunk, hashing it and enforcing a size cap"""
+    if max_bytes is None:
+        max_bytes = upload_config.MAX_UPLOAD_BYTES
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=upload_config.SPOOL_DIR or None)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit"
+                    )
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path=path, size=size, sha256=digest.hexdigest())
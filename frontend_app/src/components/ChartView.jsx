@@ -0,0 +1,141 @@
+// Renders the Vega-Lite subset produced by the agent's chart() tool
+// (mark: bar | line | point | area; encodings: x, y, color) as plain SVG.
+
+const WIDTH = 640;
+const HEIGHT = 320;
+const MARGIN = { top: 16, right: 16, bottom: 48, left: 56 };
+const COLORS = ['#f97316', '#3b82f6', '#22c55e', '#eab308', '#a855f7', '#ec4899', '#14b8a6', '#ef4444'];
+
+function toValue(value, type) {
+  if (type === 'temporal') return new Date(value).getTime();
+  if (type === 'quantitative') return Number(value);
+  return String(value);
+}
+
+function linearScale(min, max, from, to) {
+  const span = max - min || 1;
+  return (v) => from + ((v - min) / span) * (to - from);
+}
+
+function ticks(min, max, count = 5) {
+  const step = (max - min) / count || 1;
+  return Array.from({ length: count + 1 }, (_, i) => min + step * i);
+}
+
+function formatTick(value, type) {
+  if (type === 'temporal') return new Date(value).toLocaleDateString();
+  if (typeof value === 'number') return Math.abs(value) >= 1000 ? value.toLocaleString(undefined, { maximumFractionDigits: 0 }) : +value.toFixed(2);
+  return value;
+}
+
+function ChartView({ spec }) {
+  const { mark, encoding, data, title } = spec;
+  const { x, y, color } = encoding;
+  const rows = data.values;
+  const plotWidth = WIDTH - MARGIN.left - MARGIN.right;
+  const plotHeight = HEIGHT - MARGIN.top - MARGIN.bottom;
+
+  const series = new Map();
+  for (const row of rows) {
+    const key = color ? String(row[color.field]) : '';
+    if (!series.has(key)) series.set(key, []);
+    series.get(key).push(row);
+  }
+  const seriesKeys = [...series.keys()];
+
+  const categoricalX = x.type === 'nominal' || x.type === 'ordinal';
+  const categories = categoricalX ? [...new Set(rows.map((r) => String(r[x.field])))] : [];
+  const band = categoricalX ? plotWidth / Math.max(categories.length, 1) : 0;
+
+  const xs = rows.map((r) => toValue(r[x.field], x.type));
+  const ys = rows.map((r) => toValue(r[y.field], y.type));
+  const yMin = Math.min(0, ...ys);
+  const yMax = Math.max(...ys);
+  const xMin = categoricalX ? 0 : Math.min(...xs);
+  const xMax = categoricalX ? 0 : Math.max(...xs);
+
+  const scaleY = linearScale(yMin, yMax, plotHeight, 0);
+  const scaleX = categoricalX
+    ? (v) => categories.indexOf(String(v)) * band + band / 2
+    : linearScale(xMin, xMax, 0, plotWidth);
+
+  const markType = mark.type;
+  const barWidth = categoricalX ? (band * 0.8) / seriesKeys.length : 6;
+
+  return (
+    <figure className="w-full">
+      {title && <figcaption className="mb-2 text-sm font-medium text-foreground/90">{title}</figcaption>}
+      <svg viewBox={`0 0 ${WIDTH} ${HEIGHT}`} className="w-full" role="img" aria-label={title || 'chart'}>
+        <g transform={`translate(${MARGIN.left},${MARGIN.top})`}>
+          {ticks(yMin, yMax).map((t) => (
+            <g key={t} transform={`translate(0,${scaleY(t)})`}>
+              <line x2={plotWidth} stroke="currentColor" strokeOpacity="0.1" />
+              <text x={-8} dy="0.32em" textAnchor="end" fontSize="11" fill="currentColor" fillOpacity="0.7">
+                {formatTick(t, y.type)}
+              </text>
+            </g>
+          ))}
+          {(categoricalX ? categories : ticks(xMin, xMax)).map((t) => (
+            <text
+              key={t}
+              x={scaleX(t)}
+              y={plotHeight + 16}
+              textAnchor="middle"
+              fontSize="11"
+              fill="currentColor"
+              fillOpacity="0.7"
+            >
+              {categoricalX ? t : formatTick(t, x.type)}
+            </text>
+          ))}
+          {seriesKeys.map((key, i) => {
+            const fill = COLORS[i % COLORS.length];
+            const points = series.get(key)
+              .map((r) => [scaleX(toValue(r[x.field], x.type)), scaleY(toValue(r[y.field], y.type))])
+              .sort((a, b) => (categoricalX ? 0 : a[0] - b[0]));
+            if (markType === 'bar') {
+              return points.map(([px, py], j) => (
+                <rect
+                  key={`${key}-${j}`}
+                  x={px - (categoricalX ? band * 0.4 : barWidth / 2) + (categoricalX ? barWidth * i : 0)}
+                  y={Math.min(py, scaleY(0))}
+                  width={barWidth}
+                  height={Math.abs(scaleY(0) - py)}
+                  fill={fill}
+                />
+              ));
+            }
+            const path = points.map(([px, py], j) => `${j ? 'L' : 'M'}${px},${py}`).join('');
+            if (markType === 'line') {
+              return <path key={key} d={path} fill="none" stroke={fill} strokeWidth="2" />;
+            }
+            if (markType === 'area') {
+              const baseline = scaleY(Math.max(yMin, 0));
+              const closed = `${path}L${points[points.length - 1][0]},${baseline}L${points[0][0]},${baseline}Z`;
+              return <path key={key} d={closed} fill={fill} fillOpacity="0.5" stroke={fill} />;
+            }
+            return points.map(([px, py], j) => <circle key={`${key}-${j}`} cx={px} cy={py} r="3" fill={fill} />);
+          })}
+          <text x={plotWidth / 2} y={plotHeight + 38} textAnchor="middle" fontSize="12" fill="currentColor">
+            {x.title}
+          </text>
+          <text transform={`translate(${-44},${plotHeight / 2}) rotate(-90)`} textAnchor="middle" fontSize="12" fill="currentColor">
+            {y.title}
+          </text>
+        </g>
+      </svg>
+      {color && (
+        <div className="mt-2 flex flex-wrap gap-3 text-xs text-muted-foreground">
+          {seriesKeys.map((key, i) => (
+            <span key={key} className="flex items-center gap-1">
+              <span className="inline-block h-2 w-2 rounded-full" style={{ background: COLORS[i % COLORS.length] }} />
+              {key}
+            </span>
+          ))}
+        </div>
+      )}
+    </figure>
+  );
+}
+
+export default ChartView;
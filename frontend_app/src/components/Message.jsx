@@ -1,4 +1,5 @@
 import { User, Sparkles, BarChart3 } from 'lucide-react';
+import ChartView from './ChartView';
 
 function Message({ message }) {
   const isUser = message.role === 'user';
@@ -45,19 +46,36 @@ function Message({ message }) {
               </p>
             </div>
 
-            {message.hasPlot && (
-              <div className="mt-4 overflow-hidden rounded-lg border border-border bg-card/50">
+            {message.hasPlot && (message.plots?.length ? message.plots : [{ position: 0 }]).map((plot) => (
+              <div key={plot.position} className="mt-4 overflow-hidden rounded-lg border border-border bg-card/50">
                 <div className="flex items-center gap-2 border-b border-border bg-muted/50 px-4 py-2">
                   <BarChart3 className="h-4 w-4 text-muted-foreground" />
                   <span className="text-sm font-medium text-muted-foreground">
                     Data Visualization
                   </span>
                 </div>
-                <div className="p-6 text-center text-sm text-muted-foreground">
-                  [Chart would render here]
-                </div>
+                {plot.chartSpec ? (
+                  <div className="p-4 text-foreground">
+                    <ChartView spec={plot.chartSpec} />
+                  </div>
+                ) : plot.imageUrl ? (
+                  // Thumbnails load lazily and in parallel as they scroll into view; click for full size
+                  <a href={plot.imageUrl} target="_blank" rel="noreferrer">
+                    <img
+                      src={plot.thumbnailUrl || plot.imageUrl}
+                      alt="Data visualization"
+                      loading="lazy"
+                      decoding="async"
+                      className="w-full"
+                    />
+                  </a>
+                ) : (
+                  <div className="p-6 text-center text-sm text-muted-foreground">
+                    [Chart would render here]
+                  </div>
+                )}
               </div>
-            )}
+            ))}
           </div>
         </div>
       </div>
@@ -52,7 +52,30 @@ export const mockMessages = {
       content: 'Here is your spending breakdown by category',
       timestamp: '2025-01-18T10:32:10',
       cost: 0.0024,
-      hasPlot: true
+      hasPlot: true,
+      plots: [
+        {
+          position: 0,
+          kind: 'chart',
+          chartSpec: {
+            $schema: 'https://vega.github.io/schema/vega-lite/v5.json',
+            title: 'Spending by category',
+            mark: { type: 'bar' },
+            encoding: {
+              x: { field: 'Category', type: 'nominal', title: 'Category' },
+              y: { field: 'total', type: 'quantitative', title: 'Total spend (₹)' }
+            },
+            data: {
+              values: [
+                { Category: 'Food', total: 33468.31 },
+                { Category: 'Shopping', total: 21540.0 },
+                { Category: 'Travel', total: 12875.5 },
+                { Category: 'Bills', total: 9800.0 }
+              ]
+            }
+          }
+        }
+      ]
     }
   ],
   '2': [
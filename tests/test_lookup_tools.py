@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import time
+import polars as pl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "agent"))
+
+from agents.analysis import analysisAgent
+from tools.tools import Tools
+
+
+def _merchants(n: int) -> pl.DataFrame:
+    return pl.DataFrame({"merchant": [f"merchant {i} store {i % 977}" for i in range(n)], "amount": list(range(n))})
+
+
+async def _max_loop_gap(coroutine) -> tuple[float, float, object]:
+    """Run coroutine while a ticker measures the longest the event loop went without running it"""
+    gaps = []
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.monotonic()
+        while not done.is_set():
+            await asyncio.sleep(0.005)
+            now = time.monotonic()
+            gaps.append(now - last)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    started = time.monotonic()
+    result = await coroutine
+    elapsed = time.monotonic() - started
+    done.set()
+    await tick
+    return max(gaps), elapsed, result
+
+
+def test_find_values_keeps_event_loop_responsive():
+    # No stored value index, so the first lookup builds the column's trigram index
+    df = _merchants(300_000)
+    agent = analysisAgent(df, "test", tools=Tools(df))
+    max_gap, elapsed, result = asyncio.run(_max_loop_gap(agent.find_values("merchant", ["merchant 12 store"])))
+
+    assert result["candidates"], result
+    assert elapsed > 0.2, "lookup too fast to tell whether it blocks the loop"
+    assert max_gap < 0.1, f"event loop blocked for {max_gap:.3f}s during a {elapsed:.3f}s lookup"
+
+
+def test_distinct_values_keeps_event_loop_responsive():
+    # No stored distinct index, so the column is scanned on first use
+    df = _merchants(2_000_000).with_columns(store=pl.col("amount") % 97)
+    agent = analysisAgent(df, "test", tools=Tools(df))
+    max_gap, elapsed, result = asyncio.run(_max_loop_gap(agent.distinct_values("store")))
+
+    assert result.get("status") != "failed", result
+    assert max_gap < 0.1, f"event loop blocked for {max_gap:.3f}s during a {elapsed:.3f}s lookup"
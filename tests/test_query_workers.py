@@ -0,0 +1,53 @@
+import os
+import sys
+import polars as pl
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "agent"))
+
+from tools.out_of_core import OutOfCoreError, QueryWorkerPool
+
+MB = 1024 * 1024
+
+
+def _idle_pids(pool: QueryWorkerPool) -> set:
+    return {worker.process.pid for worker in pool._idle}
+
+
+def test_workers_are_reused_across_queries():
+    pool = QueryWorkerPool(idle_workers=2, max_queries=100, recycle_rss_bytes=512 * MB)
+    lf = pl.LazyFrame({"a": [1, 2, 3]}).select(pl.col("a").sum())
+    try:
+        assert pool.collect(lf, memory_limit_bytes=1024 * MB, max_rows=None)["a"][0] == 6
+        pids = _idle_pids(pool)
+        assert len(pids) == 1
+        # A failed query leaves its worker usable
+        with pytest.raises(OutOfCoreError):
+            pool.collect(pl.LazyFrame({"a": [1]}).select(pl.col("missing")), memory_limit_bytes=1024 * MB, max_rows=None)
+        pool.collect(lf, memory_limit_bytes=1024 * MB, max_rows=None)
+        assert _idle_pids(pool) == pids
+    finally:
+        pool.close()
+
+
+def test_worker_over_memory_ceiling_is_replaced():
+    pool = QueryWorkerPool(idle_workers=2, max_queries=100, recycle_rss_bytes=512 * MB)
+    sort = pl.LazyFrame({"a": range(30_000_000)}).with_columns((pl.col("a") * 2).alias("b")).sort("b", descending=True)
+    try:
+        pool.collect(pl.LazyFrame({"a": [1]}), memory_limit_bytes=1024 * MB, max_rows=None)
+        pids = _idle_pids(pool)
+        with pytest.raises(OutOfCoreError, match="memory ceiling"):
+            pool.collect(sort, memory_limit_bytes=150 * MB, max_rows=None)
+        assert not _idle_pids(pool) & pids
+        assert pool.collect(pl.LazyFrame({"a": [1]}), memory_limit_bytes=1024 * MB, max_rows=None).height == 1
+    finally:
+        pool.close()
+
+
+def test_worker_holding_memory_after_a_query_is_retired():
+    pool = QueryWorkerPool(idle_workers=2, max_queries=100, recycle_rss_bytes=1)
+    try:
+        pool.collect(pl.LazyFrame({"a": [1]}), memory_limit_bytes=1024 * MB, max_rows=None)
+        assert not pool._idle
+    finally:
+        pool.close()